@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, Header
+from fastapi.responses import Response
 from app.models.auth import (
     MagicLinkRequest, MagicLinkResponse, SetPasswordRequest, LoginRequest, LoginResponse,
     ResetPasswordRequest, ResetPasswordResponse, RegisterRequest, RegisterResponse, UserResponse,
     ValidationEmailRequest, ValidationEmailResponse, VerifyOTPRequest, VerifyOTPResponse
 )
 from app.models.base import APIResponse, APIError, api_response
-import os
-from supabase import create_client, Client
+from app.middleware.http_cache import cache_control
 from app.services.auth_service import (
     send_magic_link_service,
     set_password_service,
@@ -15,13 +15,10 @@ from app.services.auth_service import (
     register_service,
     get_current_user_service,
     send_otp_email_service,
-    verify_otp_service
+    verify_otp_service,
+    user_response
 )
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 router = APIRouter()
 
 # --- Endpoints ---
@@ -54,23 +51,29 @@ def register(data: RegisterRequest):
 def verify_otp(data: VerifyOTPRequest):
     return verify_otp_service(data)
 
+# Raised by the auth dependencies when the token is rejected. response is the api_response of
+# get_current_user_service, returned as it is by the handler in app/main.py.
+class AuthenticationError(Exception):
+    def __init__(self, response: Response):
+        super().__init__("Invalid or expired token")
+        self.response = response
+
+# get_current_user_service returns an api_response when the token is rejected.
+# A dependency cannot return a response, so it is raised to stop the request there.
+def _require_user(result):
+    if isinstance(result, Response):
+        raise AuthenticationError(result)
+    return result
+
 def get_current_user(authorization: str = Header(...)):
-    return get_current_user_service(authorization)
+    return _require_user(get_current_user_service(authorization))
+
+# Same as get_current_user, but always asks Supabase, so revoked sessions are rejected immediately.
+# Use it on routes where acting on a revoked token is not acceptable.
+def get_current_user_strict(authorization: str = Header(...)):
+    return _require_user(get_current_user_service(authorization, verify_remote=True))
 
-@router.get("/me", response_model=APIResponse[UserResponse])
+@router.get("/me", response_model=APIResponse[UserResponse], dependencies=[Depends(cache_control("private, no-cache"))])
 def me(user=Depends(get_current_user)):
     # Return the authenticated user's info from Supabase
-    return api_response(
-        data=UserResponse(
-            id=user["id"],
-            email=user["email"],
-            username=user["user_metadata"].get("username", ""),
-            first_name=user["user_metadata"].get("first_name", ""),
-            last_name=user["user_metadata"].get("last_name", ""),
-            birth_date=user["user_metadata"].get("birth_date", ""),
-            document_id=user["user_metadata"].get("document_id", ""),
-            address=user["user_metadata"].get("address", ""),
-            phone=user["user_metadata"].get("phone", "")
-        ),
-        status_code=200
-    ) 
\ No newline at end of file
+    return api_response(data=user_response(user), status_code=200) 
\ No newline at end of file
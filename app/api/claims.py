@@ -1,42 +1,77 @@
-from fastapi import APIRouter, Query, Path, Depends
-from app.api.auth import get_current_user
+from fastapi import APIRouter, Query, Path, Header, Depends
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.api.auth import get_current_user, get_current_user_strict
 from app.models.base import APIResponse, APIError, api_response
-from app.models.claim import ClaimSummary, ClaimDetail, ClaimCreateRequest, ClaimCreateResponse
+from app.models.claim import ClaimSummary, ClaimDetail, ClaimCreateRequest, ClaimSubmission
+from app.middleware.http_cache import cache_control
 from typing import List, Optional
 from app.services.claim_service import (
-    list_claims_service,
+    list_claims_service_async,
     get_claim_service,
-    create_claim_service
+    create_claim_service,
+    get_claim_submission_service
 )
+from app.services.claim_stream import stream_claims_service
 
 router = APIRouter()
 
-@router.get("", response_model=APIResponse[List[ClaimSummary]])
-def list_claims(user=Depends(get_current_user),
+# Claim status changes are what clients poll for: always revalidate (a 304 when nothing changed)
+CLAIMS_CACHE_CONTROL = "private, no-cache"
+
+@router.get("", response_model=APIResponse[List[ClaimSummary]], dependencies=[Depends(cache_control(CLAIMS_CACHE_CONTROL))])
+async def list_claims(user=Depends(get_current_user),
     policy_id: Optional[str] = Query(None, description="Filter by policy id"),
     status: Optional[str] = Query(None, description="Filter by claim status"),
     type: Optional[str] = Query(None, description="Filter by claim type"),
     page: int = Query(1, ge=1, description="Page number for pagination"),
-    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination")
+    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor; returns the page after it (page is ignored)"),
+    include_count: bool = Query(True, description="Include the total number of matching items in count")
 ) -> APIResponse[List[ClaimSummary]]:
     """
-    Returns a list of all user claims with optional filters and pagination (mocked).
+    Returns a list of all user claims with optional filters and pagination, fetched from the SOAP backend.
+    Supports page/page_size or keyset pagination with cursor/next_cursor.
+    Async: the backend call does not hold a threadpool worker while it waits.
+    Uses api_response to ensure the HTTP status code matches the status_code in the response body.
+    """
+    return await list_claims_service_async(user["id"], policy_id, status, type, page, page_size, cursor, include_count)
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_claims(user=Depends(get_current_user),
+    last_event_id: Optional[str] = Header(None, description="id of the last event received, to resume after a reconnection")):
+    """
+    Server-Sent Events stream of the changes to the user's claims (claim_added, claim_updated, claim_removed),
+    instead of polling GET /v1/claims. The backend is polled once per process for all the open streams.
+    A comment is sent as heartbeat when nothing changes; reconnect with Last-Event-ID to get the missed events
+    (a reset event means they are not known anymore: reload the claims).
+    """
+    return await stream_claims_service(user["id"], last_event_id)
+
+@router.get("/submissions/{id}", response_model=APIResponse[ClaimSubmission], dependencies=[Depends(cache_control(CLAIMS_CACHE_CONTROL))])
+async def get_claim_submission(id: str, user=Depends(get_current_user)) -> APIResponse[ClaimSubmission]:
+    """
+    Returns the status of a claim submitted with POST /v1/claims: queued, processing, succeeded (with the
+    created claim) or failed (with the error).
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return list_claims_service(policy_id, status, type, page, page_size)
+    return await run_in_threadpool(get_claim_submission_service, user["id"], id)
 
-@router.get("/{id}", response_model=APIResponse[ClaimDetail])
-def get_claim(id: str, user=Depends(get_current_user)) -> APIResponse[ClaimDetail]:
+@router.get("/{id}", response_model=APIResponse[ClaimDetail], dependencies=[Depends(cache_control(CLAIMS_CACHE_CONTROL))])
+async def get_claim(id: str, user=Depends(get_current_user)) -> APIResponse[ClaimDetail]:
     """
     Returns details for a specific claim (mocked).
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return get_claim_service(id)
+    return await run_in_threadpool(get_claim_service, user["id"], id)
 
-@router.post("", response_model=APIResponse[ClaimCreateResponse])
-def create_claim(data: ClaimCreateRequest, user=Depends(get_current_user)) -> APIResponse[ClaimCreateResponse]:
+@router.post("", response_model=APIResponse[ClaimSubmission], status_code=202)
+async def create_claim(data: ClaimCreateRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Unique key of this claim: retrying with the same key does not create it twice"),
+    user=Depends(get_current_user_strict)) -> APIResponse[ClaimSubmission]:
     """
-    Creates a new claim (mocked).
+    Submits a new claim. It is stored in a durable queue and sent to the SOAP backend in the background,
+    with retries: the answer is 202 with the submission, whose status is read from GET /v1/claims/submissions/{id} (Location header).
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return create_claim_service(data)
+    return await run_in_threadpool(create_claim_service, user["id"], data, idempotency_key)
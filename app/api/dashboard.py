@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Query, Depends
+from app.api.auth import get_current_user
+from app.models.base import APIResponse
+from app.models.dashboard import DashboardResponse
+from app.services.dashboard_service import get_dashboard_service
+from app.middleware.http_cache import cache_control
+
+router = APIRouter()
+
+DASHBOARD_CACHE_CONTROL = "private, no-cache"
+
+@router.get("", response_model=APIResponse[DashboardResponse], dependencies=[Depends(cache_control(DASHBOARD_CACHE_CONTROL))])
+async def get_dashboard(user=Depends(get_current_user),
+    page_size: int = Query(5, ge=1, le=100, description="Items returned in each list section")
+) -> APIResponse[DashboardResponse]:
+    """
+    Returns everything the landing page needs in one call: the user's profile and the first page of
+    their policies, claims and documents. The token is validated once and the three lists are fetched
+    concurrently. Each section has its own status_code and error, so one failing backend does not
+    fail the whole response (the overall status is 200).
+    """
+    return await get_dashboard_service(user, page_size)
@@ -1,54 +1,23 @@
-from fastapi import APIRouter, Query, UploadFile, File, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, Query, Request, Depends
 from typing import List, Optional
-from app.api.auth import get_current_user
+from app.api.auth import get_current_user, get_current_user_strict
 from app.models.base import APIResponse, APIError, api_response
+from app.models.document import DocumentSummary, DocumentDetail, DocumentUploadResponse
+from app.middleware.http_cache import cache_control
 from app.services.document_service import (
     list_documents_service,
     get_document_service,
-    upload_document_service
+    upload_document_service,
+    download_document_service,
+    delete_document_service
 )
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
-class DocumentSummary(BaseModel):
-    id: str
-    name: str
-    category: str
-    policy_id: Optional[str]
-    claim_id: Optional[str]
-    billing: Optional[str]
-    type: str
+DOCUMENTS_CACHE_CONTROL = "private, max-age=30"
 
-class DocumentDetail(BaseModel):
-    id: str
-    name: str
-    category: str
-    policy_id: Optional[str]
-    claim_id: Optional[str]
-    billing: Optional[str]
-    type: str
-    url: str
-
-class DocumentUploadRequest(BaseModel):
-    name: str
-    category: str
-    policy_id: Optional[str]
-    claim_id: Optional[str]
-    billing: Optional[str]
-    type: str
-
-class DocumentUploadResponse(BaseModel):
-    id: str
-    name: str
-    category: str
-    policy_id: Optional[str]
-    claim_id: Optional[str]
-    billing: Optional[str]
-    type: str
-    url: str
-
-@router.get("", response_model=APIResponse[List[DocumentSummary]])
+@router.get("", response_model=APIResponse[List[DocumentSummary]], dependencies=[Depends(cache_control(DOCUMENTS_CACHE_CONTROL))])
 def list_documents(user=Depends(get_current_user),
     policy_id: Optional[str] = Query(None, description="Filter by policy id"),
     claim_id: Optional[str] = Query(None, description="Filter by claim id"),
@@ -56,33 +25,71 @@ def list_documents(user=Depends(get_current_user),
     type: Optional[str] = Query(None, description="Filter by document type"),
     category: Optional[str] = Query(None, description="Filter by document category"),
     page: int = Query(1, ge=1, description="Page number for pagination"),
-    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination")
+    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor; returns the page after it (page is ignored)"),
+    include_count: bool = Query(True, description="Include the total number of matching items in count")
 ) -> APIResponse[List[DocumentSummary]]:
     """
     Returns a list of all user documents with optional filters and pagination (mocked).
+    Supports page/page_size or keyset pagination with cursor/next_cursor.
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return list_documents_service(policy_id, claim_id, billing, type, category, page, page_size)
+    return list_documents_service(user["id"], policy_id, claim_id, billing, type, category, page, page_size, cursor, include_count)
 
-@router.get("/{id}", response_model=APIResponse[DocumentDetail])
-def get_document(id: str, user=Depends(get_current_user)) -> APIResponse[DocumentDetail]:
+@router.get("/{id}", response_model=APIResponse[DocumentDetail], dependencies=[Depends(cache_control(DOCUMENTS_CACHE_CONTROL))])
+async def get_document(id: str, request: Request,
+    download: bool = Query(False, description="Return the file itself instead of its details"),
+    user=Depends(get_current_user)) -> APIResponse[DocumentDetail]:
     """
-    Returns details for a specific document (mocked).
+    Returns details for a specific document (mocked), or with download=true the file itself.
+    Downloads are streamed and support Range/If-Range requests (206 Partial Content) and ETag/Last-Modified,
+    so interrupted downloads of large files can be resumed.
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return get_document_service(id)
+    if download:
+        return await download_document_service(user["id"], id, request)
+    return await run_in_threadpool(get_document_service, user["id"], id)
+
+# The body is read by the endpoint itself (streamed), so its multipart schema is declared here for the OpenAPI docs.
+UPLOAD_BODY_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
 
-@router.post("", response_model=APIResponse[DocumentUploadResponse])
-def upload_document(file: UploadFile = File(...),
+@router.post("", response_model=APIResponse[DocumentUploadResponse], openapi_extra=UPLOAD_BODY_SCHEMA)
+async def upload_document(request: Request,
     name: str = Query(...),
     category: str = Query(...),
     policy_id: Optional[str] = Query(None),
     claim_id: Optional[str] = Query(None),
     billing: Optional[str] = Query(None),
     type: str = Query(...),
-    user=Depends(get_current_user)) -> APIResponse[DocumentUploadResponse]:
+    sha256: Optional[str] = Query(None, min_length=64, max_length=64, pattern="^[0-9a-fA-F]{64}$",
+        description="SHA-256 of the file. If the user already stored this file, it is not uploaded again"),
+    user=Depends(get_current_user_strict)) -> APIResponse[DocumentUploadResponse]:
+    """
+    Uploads a new document. The file is streamed to the document storage in fixed-size chunks,
+    and rejected with 413 as soon as it exceeds the per-file or per-user size limit.
+    Identical files are stored once. With sha256 and "Expect: 100-continue", a file the user already
+    stored is answered before its body is sent; a file that does not match sha256 is rejected with 400.
+    Uses api_response to ensure the HTTP status code matches the status_code in the response body.
+    """
+    return await upload_document_service(user["id"], request, name, category, policy_id, claim_id, billing, type, sha256)
+
+@router.delete("/{id}", response_model=APIResponse)
+async def delete_document(id: str, user=Depends(get_current_user_strict)) -> APIResponse:
     """
-    Uploads a new document (mocked).
+    Deletes one of the user's uploaded documents. The file is deleted with the last document using it.
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return upload_document_service(file, name, category, policy_id, claim_id, billing, type) 
\ No newline at end of file
+    return await delete_document_service(user["id"], id)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Query, Path, Depends
 from app.api.auth import get_current_user
 from app.models.base import APIResponse, APIError, api_response
 from app.models.policy import PolicySummary, PolicyDetail
+from app.middleware.http_cache import cache_control
 from typing import List, Optional
 from app.services.policy_service import (
     list_policies_service,
@@ -10,23 +11,29 @@ from app.services.policy_service import (
 
 router = APIRouter()
 
-@router.get("", response_model=APIResponse[List[PolicySummary]])
+# Policies rarely change: clients may reuse a response for a minute before revalidating
+POLICIES_CACHE_CONTROL = "private, max-age=60"
+
+@router.get("", response_model=APIResponse[List[PolicySummary]], dependencies=[Depends(cache_control(POLICIES_CACHE_CONTROL))])
 def list_policies(user=Depends(get_current_user),
     type: Optional[str] = Query(None, description="Filter by policy type"),
     status: Optional[str] = Query(None, description="Filter by policy status"),
     page: int = Query(1, ge=1, description="Page number for pagination"),
-    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination")
+    page_size: int = Query(10, ge=1, le=100, description="Page size for pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor; returns the page after it (page is ignored)"),
+    include_count: bool = Query(True, description="Include the total number of matching items in count")
 ) -> APIResponse[List[PolicySummary]]:
     """
     Returns a list of all user policies with optional filters and pagination (mocked).
+    Supports page/page_size or keyset pagination with cursor/next_cursor.
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return list_policies_service(type, status, page, page_size)
+    return list_policies_service(user["id"], type, status, page, page_size, cursor, include_count)
 
-@router.get("/{id}", response_model=APIResponse[PolicyDetail])
+@router.get("/{id}", response_model=APIResponse[PolicyDetail], dependencies=[Depends(cache_control(POLICIES_CACHE_CONTROL))])
 def get_policy(id: str, user=Depends(get_current_user)) -> APIResponse[PolicyDetail]:
     """
     Returns details for a specific policy (mocked).
     Uses api_response to ensure the HTTP status code matches the status_code in the response body.
     """
-    return get_policy_service(id) 
\ No newline at end of file
+    return get_policy_service(user["id"], id) 
\ No newline at end of file
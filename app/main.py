@@ -1,9 +1,19 @@
-from fastapi import FastAPI, Request, HTTPException
+import time
+# Measured until the end of this module: the import time of the app, reported at startup
+_import_started = time.perf_counter()
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.routing import APIRouter
-from fastapi.responses import JSONResponse
-from app.api import auth, policies, claims, documents
+from fastapi.responses import JSONResponse, Response
+from app.api import auth, policies, claims, documents, dashboard
 from dotenv import load_dotenv
 from app.models.base import APIResponse, APIError
+from app.middleware.metrics import MetricsMiddleware, track_in_flight
+from app.middleware.http_cache import ConditionalGetMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.services.metrics import render_metrics
+from app.services.resilience import BackendUnavailableError
+from app.services.warmup import start_up, shut_down
 import traceback
 import logging
 from fastapi.middleware.cors import CORSMiddleware
@@ -20,17 +30,36 @@ def health():
     """Health check endpoint to verify the server is running."""
     return {"status": "ok", "message": "Server is running"}
 
+@api_v1.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics: requests per route and calls to the Supabase and SOAP backends."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 api_v1.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_v1.include_router(policies.router, prefix="/policies", tags=["policies"])
 api_v1.include_router(claims.router, prefix="/claims", tags=["claims"])
 api_v1.include_router(documents.router, prefix="/documents", tags=["documents"])
+api_v1.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
 
 @api_v1.get("/", tags=["Root"])
 def root():
     return {"message": "API Insurance Customer Portal"}
 
-app = FastAPI()
+# Warms the backend clients up in the background when the worker starts (STARTUP_WARMUP), and closes
+# the SOAP session when it stops (see app/services/warmup.py)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = start_up(_imports_seconds)
+    yield
+    await shut_down(warm_up_task)
+
+app = FastAPI(dependencies=[Depends(track_in_flight)], lifespan=lifespan)
 
+# ETag / If-None-Match -> 304 for the routes that declare a Cache-Control policy (see app.middleware.http_cache)
+app.add_middleware(ConditionalGetMiddleware)
+# Outside the ETag middleware, so it compresses the responses it produced (and weakens their ETag)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # O tu dominio ["http://localhost:3000"]
@@ -38,9 +67,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it wraps the other middleware and measures the whole request
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_v1, prefix="/v1")
 
+# The token was rejected: the error envelope built by the auth service (see app/api/auth.py)
+@app.exception_handler(auth.AuthenticationError)
+async def authentication_error_handler(request: Request, exc: auth.AuthenticationError):
+    return exc.response
+
+# A backend is down, saturated or too slow: answer quickly with 503/504 instead of a generic 500
+@app.exception_handler(BackendUnavailableError)
+async def backend_unavailable_handler(request: Request, exc: BackendUnavailableError):
+    logger.warning(str(exc))
+    response = APIResponse(
+        data=None,
+        error=APIError(message="Service temporarily unavailable, please try again later", details=str(exc), code=exc.reason),
+        count=None,
+        status_code=exc.status_code
+    )
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content=response.dict(), headers=headers)
+
 # Global exception handler for uncaught exceptions
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -75,4 +124,6 @@ async def generic_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
         status_code=status_code,
         content=response.dict()
-    ) 
\ No newline at end of file
+    ) 
+
+_imports_seconds = time.perf_counter() - _import_started
@@ -0,0 +1,197 @@
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+# Response compression negotiated from Accept-Encoding: zstd, br (brotli) or gzip.
+# gzip is always available; br requires the brotli package and zstd the zstandard package.
+# Streamed responses (e.g. document downloads) are compressed chunk by chunk as they go out, never buffered.
+
+# Bodies smaller than this (bytes) are sent as they are: compressing them saves less than it costs
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+# Encodings the server offers, preferred first (used when the client accepts several with the same q)
+COMPRESSION_ENCODINGS = [e.strip() for e in os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+
+# Content types that are already compressed: compressing them again only burns CPU
+_SKIPPED_TYPES = ("image/", "video/", "audio/")
+_SKIPPED_SUBTYPES = {
+    "application/pdf", "application/zip", "application/gzip", "application/x-gzip", "application/zstd",
+    "application/x-7z-compressed", "application/x-rar-compressed", "application/octet-stream",
+    "font/woff", "font/woff2",
+}
+# image/svg+xml is text
+_COMPRESSIBLE_IMAGES = {"image/svg+xml"}
+
+class GzipCompressor:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    # Everything compressed so far, so that the client can decode it before the next chunk arrives
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+class BrotliCompressor:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        import brotli
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+class ZstdCompressor:
+    def __init__(self, level: int = COMPRESSION_ZSTD_LEVEL):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+COMPRESSORS = {"gzip": GzipCompressor}
+if _available("brotli"):
+    COMPRESSORS["br"] = BrotliCompressor
+if _available("zstandard"):
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+# Picks the encoding for an Accept-Encoding header: the highest q value among the offered encodings,
+# then the server preference. None means identity (no compression).
+def negotiate_encoding(accept_encoding: str, offered=None):
+    offered = [e for e in (offered or COMPRESSION_ENCODINGS) if e in COMPRESSORS]
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", ""):
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in _COMPRESSIBLE_IMAGES:
+        return True
+    return not (content_type.startswith(_SKIPPED_TYPES) or content_type in _SKIPPED_SUBTYPES)
+
+def _set_encoding_headers(headers: MutableHeaders, encoding: str):
+    headers["content-encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    # The compressed bytes are a different representation: a strong ETag becomes weak, which
+    # If-None-Match still matches (weak comparison) while Range/If-Range no longer apply to it
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = "W/" + etag
+
+# ASGI middleware compressing the responses with the encoding negotiated from Accept-Encoding.
+# Skipped: bodies below minimum_size, already compressed content types (PDF, JPEG, ...), partial content,
+# responses that already have a Content-Encoding and zero-copy file sends (http.response.pathsend).
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(request_headers.get("accept-encoding", ""))
+        # Range requests are answered on the identity representation
+        if encoding is None or "range" in request_headers:
+            await self.app(scope, receive, send)
+            return
+        held_start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal held_start, compressor
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_length = headers.get("content-length")
+                if (message["status"] < 200 or message["status"] in (204, 206, 304) or not _compressible(headers)
+                        or (content_length is not None and int(content_length) < self.minimum_size)):
+                    await send(message)
+                    return
+                # Sent with the first body chunk, once it is known whether the body is big enough
+                held_start = message
+                return
+
+            if message["type"] != "http.response.body":
+                if held_start is not None:
+                    await send(held_start)
+                    held_start = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if held_start is not None:
+                start, held_start = held_start, None
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding]()
+                headers = MutableHeaders(scope=start)
+                _set_encoding_headers(headers, encoding)
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["content-length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+            if compressor is None:
+                await send(message)
+                return
+            if more_body:
+                data = compressor.compress(body) + compressor.flush() if body else b""
+                if data:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.compress(body) + compressor.finish()})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,95 @@
+import hashlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+
+# Conditional GET for the read endpoints.
+# A route opts in with the cache_control() dependency, which sets its Cache-Control policy. Its 200 responses
+# then get a strong ETag (the one the endpoint already set, e.g. the SHA-256 of a stored file, or a hash of the
+# serialized body), and a request whose If-None-Match matches it gets an empty 304 Not Modified instead.
+
+_SCOPE_KEY = "cache_control"
+
+# Dependency setting the Cache-Control policy of a route, e.g.
+#   @router.get("", dependencies=[Depends(cache_control("private, no-cache"))])
+# The responses are per user, so the policies should be "private"; "no-cache" makes clients revalidate
+# with If-None-Match every time, which costs a 304 without body when nothing changed.
+def cache_control(value: str):
+    def set_cache_control(request: Request):
+        request.scope[_SCOPE_KEY] = value
+    return set_cache_control
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+# If-None-Match uses the weak comparison: W/"x" matches "x".
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def _not_modified(start_message, headers: MutableHeaders):
+    # A 304 carries the validators and caching headers but no body (RFC 9110 section 15.4.5)
+    for name in ("content-length", "content-type", "content-range", "content-disposition"):
+        if name in headers:
+            del headers[name]
+    return {**start_message, "status": 304}
+
+class ConditionalGetMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        held_start = None
+        # Once a 304 has been sent, the rest of the body the endpoint produces is dropped
+        drop_body = False
+
+        async def send_conditional(message):
+            nonlocal held_start, drop_body
+            if message["type"] == "http.response.start":
+                policy = scope.get(_SCOPE_KEY)
+                if policy is None or message["status"] != 200:
+                    await send(message)
+                    return
+                headers = MutableHeaders(scope=message)
+                headers["cache-control"] = policy
+                headers.add_vary_header("Authorization")
+                etag = headers.get("etag")
+                if etag is None:
+                    # Wait for the body to hash it
+                    held_start = message
+                    return
+                if if_none_match and _matches(if_none_match, etag):
+                    drop_body = True
+                    await send(_not_modified(message, headers))
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                await send(message)
+                return
+
+            if drop_body:
+                return
+            if held_start is None:
+                await send(message)
+                return
+            start, held_start = held_start, None
+            if message.get("more_body", False):
+                # Streamed body: it cannot be hashed before it is sent, so it goes out without an ETag
+                await send(start)
+                await send(message)
+                return
+            headers = MutableHeaders(scope=start)
+            etag = strong_etag(message.get("body", b""))
+            headers["etag"] = etag
+            if if_none_match and _matches(if_none_match, etag):
+                await send(_not_modified(start, headers))
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_conditional)
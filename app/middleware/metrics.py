@@ -0,0 +1,50 @@
+import time
+from starlette.requests import Request
+from app.services.metrics import observe_request, request_in_flight
+
+# Route label of a request: the path template of the matched route (e.g. "/v1/claims/{id}"),
+# so that all the requests to the same endpoint share one series. Requests that matched no route are "unmatched".
+def route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Depending on the FastAPI version, the route of an included router knows its full path or only its own
+    # (e.g. "/{id}"): the router prefixes are then the leading segments of the request path it does not cover.
+    template = route.path.split("/")[1:] if route.path else []
+    segments = scope["path"].split("/")[1:]
+    return "/" + "/".join(segments[:max(len(segments) - len(template), 0)] + template)
+
+# ASGI middleware recording the count and latency of every HTTP request, by method, route and status code.
+# The route is only known once the router has matched the request, so it is read from the scope afterwards.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        # An exception that escapes the app is turned into a 500 by the outer error handler
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            observe_request(scope["method"], route_template(scope), status, time.perf_counter() - start)
+
+# Application-wide dependency keeping the in-flight gauge of the matched route.
+# It runs once the route is known, which the middleware above cannot do before calling the app.
+async def track_in_flight(request: Request):
+    gauge = request_in_flight(request.method, route_template(request.scope))
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
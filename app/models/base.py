@@ -1,7 +1,8 @@
-from typing import Optional, Generic, TypeVar
+from typing import Any, Optional, Generic, TypeVar
+import orjson
 from pydantic import BaseModel
 from pydantic.generics import GenericModel
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 
 T = TypeVar("T")
 
@@ -16,15 +17,51 @@ class APIResponse(GenericModel, Generic[T]):
     error: Optional[APIError]
     count: Optional[int]
     status_code: int
+    next_cursor: Optional[str] = None
 
 
-def api_response(*, data=None, error=None, count=None, status_code=200):
+# Called by orjson for the objects it cannot serialize natively (the pydantic models).
+def _json_default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+try:
+    # pydantic v2: pydantic-core serializes the content, models included, straight to bytes
+    from pydantic_core import to_json as _dumps
+except ImportError:
+    # pydantic v1: orjson, dumping the models as they are encoded
+    def _dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_json_default)
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered in a single pass, without building intermediate copies of the models.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+
+def api_response(*, data=None, error=None, count=None, status_code=200, next_cursor=None):
     """
     Helper to return a standardized APIResponse as a JSONResponse,
     ensuring the HTTP status code matches the status_code in the response body.
     Usage:
         return api_response(data=..., status_code=201)
         return api_response(error=APIError(message="..."), status_code=401)
+        return api_response(data=page, count=total, next_cursor=cursor, status_code=200)
+    The envelope has the same fields as APIResponse, but it is encoded directly from the already-typed
+    models instead of being validated again as an APIResponse and converted with .dict().
+    Endpoints returning a Response are not validated again against their response_model by FastAPI,
+    which keeps response_model for the OpenAPI schema only.
     """
-    response = APIResponse(data=data, error=error, count=count, status_code=status_code)
-    return JSONResponse(status_code=status_code, content=response.dict()) 
\ No newline at end of file
+    content = {
+        "data": data,
+        "error": error,
+        "count": count,
+        "status_code": status_code,
+        "next_cursor": next_cursor,
+    }
+    return FastJSONResponse(status_code=status_code, content=content)
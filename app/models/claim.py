@@ -9,6 +9,8 @@ class ClaimSummary(BaseModel):
     description: str
     policy_id: str
     contract_name: str
+    # Claim type, when the backend sends one (filtered with the type parameter of GET /v1/claims)
+    type: Optional[str] = None
 
 class ClaimDetail(BaseModel):
     id: str
@@ -21,6 +23,7 @@ class ClaimDetail(BaseModel):
 
 class ClaimCreateRequest(BaseModel):
     description: str
+    policy_id: str
     open_date: Optional[str] = None
 
 class ClaimCreateResponse(BaseModel):
@@ -30,4 +33,13 @@ class ClaimCreateResponse(BaseModel):
     open_date: str
     description: str
     policy_id: str
-    contract_name: str 
\ No newline at end of file
+    contract_name: str
+
+# A claim submitted with POST /v1/claims, sent to the backend in the background.
+# status: queued, processing, succeeded (claim is set) or failed (error is set).
+class ClaimSubmission(BaseModel):
+    id: str
+    status: str
+    attempts: int
+    claim: Optional[ClaimCreateResponse] = None
+    error: Optional[str] = None
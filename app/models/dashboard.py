@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+from typing import Generic, List, Optional, TypeVar
+from app.models.base import APIError
+from app.models.auth import UserResponse
+from app.models.policy import PolicySummary
+from app.models.claim import ClaimSummary
+from app.models.document import DocumentSummary
+
+T = TypeVar("T")
+
+# One section of the dashboard: the same envelope as the matching list endpoint,
+# plus `stale` when it was served from the cache while the backend is being refreshed.
+class DashboardSection(GenericModel, Generic[T]):
+    data: Optional[T]
+    error: Optional[APIError]
+    count: Optional[int]
+    status_code: int
+    next_cursor: Optional[str] = None
+    stale: bool = False
+
+class DashboardResponse(BaseModel):
+    user: UserResponse
+    policies: DashboardSection[List[PolicySummary]]
+    claims: DashboardSection[List[ClaimSummary]]
+    documents: DashboardSection[List[DocumentSummary]]
@@ -36,4 +36,6 @@ class DocumentUploadResponse(BaseModel):
     claim_id: Optional[str]
     billing: Optional[str]
     type: str
-    url: str 
\ No newline at end of file
+    url: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None 
\ No newline at end of file
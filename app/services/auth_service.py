@@ -1,42 +1,86 @@
 import os
+import threading
+import httpx
 from dotenv import load_dotenv 
 load_dotenv()
-from supabase import create_client, Client
 from app.models.auth import (
     MagicLinkRequest, MagicLinkResponse, SetPasswordRequest, LoginRequest, LoginResponse,
     ResetPasswordRequest, ResetPasswordResponse, RegisterRequest, RegisterResponse, UserResponse,
     ValidationEmailRequest, ValidationEmailResponse, VerifyOTPRequest, VerifyOTPResponse
 )
 from app.models.base import APIResponse, APIError, api_response
+from app.services.metrics import TimedProxy
+from app.services.resilience import BackendUnavailableError
+from app.services.token_verifier import verify_token_locally, InvalidTokenError, VerificationUnavailableError
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# "remote": every token is checked with supabase.auth.get_user (one network round trip per request).
+# "local": tokens are verified in-process (signature, expiry, audience) and Supabase is only called as a fallback.
+SUPABASE_AUTH_MODE = os.environ.get("SUPABASE_AUTH_MODE", "remote")
+# Seconds to wait for Supabase (connection and answer) before giving up on a call.
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 10))
+
+# The Supabase client is created on first use and then shared by every request. Importing supabase and
+# building the client is a noticeable part of the cold start, and many requests never need it (local auth mode).
+_supabase = None
+_supabase_lock = threading.Lock()
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                from supabase import create_client, ClientOptions
+                _supabase = create_client(
+                    SUPABASE_URL, SUPABASE_KEY,
+                    options=ClientOptions(httpx_client=httpx.Client(timeout=SUPABASE_TIMEOUT))
+                )
+    return _supabase
+
+# supabase.auth with every call timed in the backend_call_duration_seconds metric
+auth = TimedProxy(lambda: get_supabase().auth, "supabase", "auth", lazy=True)
+
+# supabase-py v1 returned plain dicts; v2 returns pydantic models (and raises AuthError instead of returning an error).
+# These helpers read both, so the services below work with either version.
+def _field(res, name):
+    if isinstance(res, dict):
+        return res.get(name)
+    return getattr(res, name, None)
+
+def _as_dict(obj):
+    if obj is None or isinstance(obj, dict):
+        return obj
+    return obj.model_dump(mode="json") if hasattr(obj, "model_dump") else obj.dict()
 
 def send_magic_link_service(data: MagicLinkRequest):
-    res = supabase.auth.sign_in_with_otp({"email": data.email})
+    res = auth.sign_in_with_otp({"email": data.email})
     if res.get("error"):
         return api_response(error=APIError(message=res["error"]["message"]), status_code=400)
     return api_response(data=MagicLinkResponse(message="Magic link sent to email."), status_code=200)
 
 def set_password_service(data: SetPasswordRequest):
-    res = supabase.auth.verify_otp({"token": data.token, "type": "email"})
+    res = auth.verify_otp({"token": data.token, "type": "email"})
     if res.get("error"):
         return api_response(error=APIError(message=res["error"]["message"]), status_code=400)
     user = res.get("user")
     if not user:
         return api_response(error=APIError(message="Invalid token."), status_code=400)
-    update_res = supabase.auth.update_user({"password": data.password})
+    update_res = auth.update_user({"password": data.password})
     if update_res.get("error"):
         return api_response(error=APIError(message=update_res["error"]["message"]), status_code=400)
     return api_response(data=MagicLinkResponse(message="Password set successfully."), status_code=200)
 
 def login_service(data: LoginRequest):
-    res = supabase.auth.sign_in_with_password({"email": data.email, "password": data.password})
-    if res.get("error"):
+    from supabase import AuthError
+    try:
+        res = auth.sign_in_with_password({"email": data.email, "password": data.password})
+    except AuthError as e:
+        return api_response(error=APIError(message=e.message), status_code=401)
+    if _field(res, "error"):
         return api_response(error=APIError(message=res["error"]["message"]), status_code=401)
-    session = res.get("session")
-    user = res.get("user")
+    session = _as_dict(_field(res, "session"))
+    user = _as_dict(_field(res, "user"))
     if not session or not user:
         return api_response(error=APIError(message="Invalid credentials."), status_code=401)
     return api_response(
@@ -49,7 +93,7 @@ def login_service(data: LoginRequest):
     )
 
 def reset_password_service(data: ResetPasswordRequest):
-    res = supabase.auth.reset_password_for_email(data.email)
+    res = auth.reset_password_for_email(data.email)
     if res.get("error"):
         return api_response(error=APIError(message=res["error"]["message"]), status_code=400)
     return api_response(data=ResetPasswordResponse(message="Password reset email sent."), status_code=200)
@@ -67,18 +111,50 @@ def register_service(data: RegisterRequest):
         status_code=201
     )
 
-def get_current_user_service(authorization: str):
+def get_current_user_service(authorization: str, verify_remote: bool = False):
+    # verify_remote forces the Supabase round trip even in local mode,
+    # for routes that must notice a revoked session immediately.
     if not authorization.startswith("Bearer "):
         return api_response(error=APIError(message="Invalid authorization header"), status_code=401)
     token = authorization.replace("Bearer ", "")
-    res = supabase.auth.get_user(token)
-    if not res.get("user"):
+    if SUPABASE_AUTH_MODE == "local" and not verify_remote:
+        try:
+            return verify_token_locally(token)
+        except InvalidTokenError:
+            return api_response(error=APIError(message="Invalid or expired token"), status_code=401)
+        except VerificationUnavailableError:
+            # The signing keys could not be loaded: let Supabase decide
+            pass
+    from supabase import AuthError
+    try:
+        res = auth.get_user(token)
+    except AuthError:
+        res = None
+    except httpx.TimeoutException:
+        raise BackendUnavailableError("supabase", "timeout")
+    user = _as_dict(_field(res, "user"))
+    if not user:
         return api_response(error=APIError(message="Invalid or expired token"), status_code=401)
-    return res["user"]
+    return user
+
+# Profile of the authenticated user (as returned by get_current_user_service), as sent to the frontend.
+def user_response(user: dict) -> UserResponse:
+    metadata = user.get("user_metadata") or {}
+    return UserResponse(
+        id=user["id"],
+        email=user["email"],
+        username=metadata.get("username", ""),
+        first_name=metadata.get("first_name", ""),
+        last_name=metadata.get("last_name", ""),
+        birth_date=metadata.get("birth_date", ""),
+        document_id=metadata.get("document_id", ""),
+        address=metadata.get("address", ""),
+        phone=metadata.get("phone", "")
+    )
 
 def send_otp_email_service(data: ValidationEmailRequest):
     try:
-        res = supabase.auth.sign_in_with_otp({
+        res = auth.sign_in_with_otp({
             "email": data.email,
             "options": {
                 "should_create_user": False
@@ -101,7 +177,7 @@ def send_otp_email_service(data: ValidationEmailRequest):
 
 def verify_otp_service(data: VerifyOTPRequest):
     try:
-        res = supabase.auth.verify_otp({
+        res = auth.verify_otp({
             "email": data.email,
             "token": data.token,
             "type": "email"
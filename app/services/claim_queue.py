@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import sqlite3
+import logging
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Durable queue of the claim submissions (POST /v1/claims), sent to the SOAP backend by a pool of worker threads.
+# A submission is stored before the request is answered (202 with its id), so it survives a restart of the worker.
+# Each worker takes the next due submission with a lease: if the process dies while sending it, another worker
+# (of any process sharing the database) takes it again once the lease has expired.
+# Failed attempts are retried with exponential backoff (and jitter), except when the backend rejects the claim.
+#
+# Status of a submission: queued -> processing -> succeeded | failed (back to queued between two attempts).
+
+# SQLite database holding the queue (shared by the workers of one host).
+CLAIM_QUEUE_DB_PATH = os.path.abspath(os.environ.get("CLAIM_QUEUE_DB_PATH", "./storage/claim_queue.db"))
+# Worker threads sending submissions to the backend, per process.
+CLAIM_QUEUE_WORKERS = int(os.environ.get("CLAIM_QUEUE_WORKERS", 4))
+# Attempts made before a submission is marked as failed.
+CLAIM_QUEUE_MAX_ATTEMPTS = int(os.environ.get("CLAIM_QUEUE_MAX_ATTEMPTS", 5))
+# Delay before the first retry, doubled after each failed attempt up to CLAIM_QUEUE_BACKOFF_MAX (seconds).
+CLAIM_QUEUE_BACKOFF = float(os.environ.get("CLAIM_QUEUE_BACKOFF", 2))
+CLAIM_QUEUE_BACKOFF_MAX = float(os.environ.get("CLAIM_QUEUE_BACKOFF_MAX", 300))
+# Seconds a worker keeps a submission before another one may take it again. Must exceed the SOAP timeouts.
+CLAIM_QUEUE_LEASE = float(os.environ.get("CLAIM_QUEUE_LEASE", 120))
+# Seconds an idle worker waits before looking for due retries (new submissions wake it up right away).
+CLAIM_QUEUE_POLL_INTERVAL = float(os.environ.get("CLAIM_QUEUE_POLL_INTERVAL", 1))
+
+# Raised when an Idempotency-Key is sent again with a different claim.
+class IdempotencyKeyReusedError(ValueError):
+    pass
+
+# Raised by the submit handler when the backend refused the claim: it is not retried.
+class SubmissionRejectedError(Exception):
+    pass
+
+# One connection per thread: sqlite3 connections cannot be shared between threads.
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+# Set when a submission is queued, to wake an idle worker up.
+_wake = threading.Event()
+_stopping = threading.Event()
+_workers = []
+
+def _connect():
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CLAIM_QUEUE_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(CLAIM_QUEUE_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS claim_submissions (
+                        id TEXT PRIMARY KEY,
+                        user_id TEXT NOT NULL,
+                        idempotency_key TEXT,
+                        request_hash TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at REAL NOT NULL,
+                        locked_until REAL,
+                        result TEXT,
+                        error TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        UNIQUE (user_id, idempotency_key)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS claim_submissions_due ON claim_submissions (status, next_attempt_at)")
+                conn.commit()
+                _initialized = True
+    return conn
+
+def _row(row):
+    if row is None:
+        return None
+    submission = dict(row)
+    submission["payload"] = json.loads(submission["payload"])
+    submission["result"] = json.loads(submission["result"]) if submission["result"] else None
+    return submission
+
+# Stores a new submission of the user and returns (submission, created). With an idempotency key already used
+# by the user, the existing submission is returned instead (created=False), whatever its status.
+# Raises IdempotencyKeyReusedError if that submission was for a different claim.
+def enqueue_submission(user_id: str, idempotency_key, payload: dict):
+    request_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    now = time.time()
+    conn = _connect()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO claim_submissions (id, user_id, idempotency_key, request_hash, payload, status,"
+        " next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+        (f"SUB{uuid.uuid4().hex[:16].upper()}", user_id, idempotency_key, request_hash, json.dumps(payload), now, now, now)
+    )
+    conn.commit()
+    created = cursor.rowcount == 1
+    if created:
+        _wake.set()
+        submission = _row(conn.execute("SELECT * FROM claim_submissions WHERE rowid = ?", (cursor.lastrowid,)).fetchone())
+    else:
+        submission = _row(conn.execute("SELECT * FROM claim_submissions WHERE user_id = ? AND idempotency_key = ?",
+                                       (user_id, idempotency_key)).fetchone())
+        if submission["request_hash"] != request_hash:
+            raise IdempotencyKeyReusedError("Idempotency-Key already used for a different claim")
+    return submission, created
+
+# Returns one of the user's submissions as a dict, or None.
+def get_submission(user_id: str, id: str):
+    return _row(_connect().execute("SELECT * FROM claim_submissions WHERE id = ? AND user_id = ?", (id, user_id)).fetchone())
+
+# Number of submissions by status, for the metrics.
+# None until the queue has been opened in this process, so a metrics scrape never creates the database.
+def get_claim_queue_stats():
+    if not _initialized:
+        return None
+    rows = _connect().execute("SELECT status, COUNT(*) FROM claim_submissions GROUP BY status").fetchall()
+    return {status: count for status, count in rows}
+
+# Takes the next due submission (or one whose lease has expired) and leases it to the calling worker.
+# A single UPDATE ... RETURNING, so two workers (or processes) never take the same one.
+def _take_next():
+    now = time.time()
+    conn = _connect()
+    row = conn.execute(
+        "UPDATE claim_submissions SET status = 'processing', attempts = attempts + 1, locked_until = ?, updated_at = ?"
+        " WHERE id = (SELECT id FROM claim_submissions"
+        "   WHERE (status = 'queued' AND next_attempt_at <= ?) OR (status = 'processing' AND locked_until <= ?)"
+        "   ORDER BY next_attempt_at LIMIT 1)"
+        " RETURNING *",
+        (now + CLAIM_QUEUE_LEASE, now, now, now)
+    ).fetchone()
+    conn.commit()
+    return _row(row)
+
+def _update(id: str, status: str, next_attempt_at=None, result=None, error=None):
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        "UPDATE claim_submissions SET status = ?, next_attempt_at = COALESCE(?, next_attempt_at), locked_until = NULL,"
+        " result = ?, error = ?, updated_at = ? WHERE id = ?",
+        (status, next_attempt_at, json.dumps(result) if result is not None else None, error, now, id)
+    )
+    conn.commit()
+
+def _backoff(attempts: int) -> float:
+    delay = min(CLAIM_QUEUE_BACKOFF_MAX, CLAIM_QUEUE_BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+# Sends one submission with handler(user_id, submission_id, payload), which returns the result to store.
+def _process(submission, handler):
+    id = submission["id"]
+    try:
+        result = handler(submission["user_id"], id, submission["payload"])
+    except SubmissionRejectedError as e:
+        logger.warning(f"Claim submission {id} rejected by the backend: {e}")
+        _update(id, "failed", error=str(e))
+    except Exception as e:
+        if submission["attempts"] >= CLAIM_QUEUE_MAX_ATTEMPTS:
+            logger.error(f"Claim submission {id} failed after {submission['attempts']} attempts: {e}")
+            # The details of the backend error are only logged
+            _update(id, "failed", error=f"The claim could not be sent to the backend after {submission['attempts']} attempts")
+        else:
+            delay = _backoff(submission["attempts"])
+            logger.warning(f"Claim submission {id} attempt {submission['attempts']} failed, retrying in {delay:.1f} s: {e}")
+            _update(id, "queued", next_attempt_at=time.time() + delay, error=str(e))
+    else:
+        _update(id, "succeeded", result=result)
+
+def _work(handler):
+    while not _stopping.is_set():
+        try:
+            submission = _take_next()
+            if submission is not None:
+                _process(submission, handler)
+                continue
+        except sqlite3.Error as e:
+            # The submission being sent, if any, is taken again once its lease expires
+            logger.error(f"Claim queue unavailable: {e}")
+        if _wake.wait(CLAIM_QUEUE_POLL_INTERVAL):
+            _wake.clear()
+
+# Starts the worker threads of the process (called at startup, see app/services/warmup.py).
+def start_claim_workers(handler):
+    _stopping.clear()
+    for i in range(CLAIM_QUEUE_WORKERS):
+        worker = threading.Thread(target=_work, args=(handler,), name=f"claim-queue-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+# Stops the worker threads, letting them finish the submission they are sending. A submission still
+# unfinished after `timeout` is taken again by a worker once its lease expires.
+def stop_claim_workers(timeout: float = 10):
+    _stopping.set()
+    _wake.set()
+    deadline = time.monotonic() + timeout
+    for worker in _workers:
+        worker.join(max(0, deadline - time.monotonic()))
+    _workers.clear()
@@ -1,47 +1,21 @@
-from app.models.base import APIResponse, api_response
-from app.models.claim import ClaimSummary, ClaimDetail, ClaimCreateRequest, ClaimCreateResponse
+import os
+from app.models.base import APIResponse, APIError, api_response
+from app.models.claim import ClaimSummary, ClaimDetail, ClaimCreateRequest, ClaimCreateResponse, ClaimSubmission
 from typing import List, Optional
-from app.services.soap_session import get_security_context
-from zeep import Client
+from app.services.soap_actions import run_action, run_action_async, stream_action_async, action_params
+from app.services.response_cache import cached, invalidate
+from app.services.pagination import paginate, PageWindow, InvalidCursorError
+from app.services.record_index import create_record_index
+from app.services.claim_queue import enqueue_submission, get_submission, IdempotencyKeyReusedError, SubmissionRejectedError
 
 # The WSDL URL for the SOAP service that handles claim-related actions
-CLAIM_SOAP_URL = "http://192.192.192.109:8080/soap/IBasActionService?wsdl"
+CLAIM_SOAP_URL = os.environ.get("CLAIM_SOAP_URL", "http://192.192.192.109:8080/soap/IBasActionService?wsdl")
+# Set to true to parse the GetClaims response while it is downloaded (see _list_claims_streaming), for backends
+# returning thousands of claims per customer. The memory used per request then depends on the page, not on the claim count.
+CLAIMS_STREAMING_PARSE = os.environ.get("CLAIMS_STREAMING_PARSE", "false").lower() in ("1", "true", "yes")
 
-# This function retrieves a list of claims from the SOAP backend
-# It manages the SOAP session automatically and calls the generic RunAction method
-# The action name ("GetClaims") must match an action implemented on the backend
-# The params dictionary can be used to pass filters or other parameters if needed
-# The function returns the data part of the SOAP response, which should contain the claims
-
-def list_claims_service(policy_id: Optional[str], status: Optional[str], type: Optional[str], page: int, page_size: int) -> APIResponse[List[ClaimSummary]]:
-    # TODO: Implement logic to fetch and filter claims from the database or external service.
-    # Should support filtering by policy_id, status, type, and pagination (page, page_size).
-    # Return a list of ClaimSummary objects and the total count.
-    data = [
-        ClaimSummary(
-            id="CLM001",
-            claim_number="CLM001",
-            status="Open",
-            open_date="2024-05-01",
-            description="Water damage in kitchen",
-            policy_id="HOM123",
-            contract_name="Home Insurance Basic"
-        ),
-        ClaimSummary(
-            id="CLM002",
-            claim_number="CLM002",
-            status="Closed",
-            open_date="2024-04-10",
-            description="Minor collision",
-            policy_id="AUT456",
-            contract_name="Auto Insurance Plus"
-        )
-    ]
-    if policy_id:
-        data = [c for c in data if c.policy_id == policy_id]
-    return api_response(data=data, count=len(data), status_code=200)
-
-def get_claim_service(id: str) -> APIResponse[ClaimDetail]:
+@cached("claims")
+def get_claim_service(user_id: str, id: str) -> APIResponse[ClaimDetail]:
     # TODO: Implement logic to fetch a specific claim by its ID from the database or external service.
     # Should return a ClaimDetail object if found, or an appropriate error if not found.
     detail = ClaimDetail(
@@ -55,33 +29,126 @@ def get_claim_service(id: str) -> APIResponse[ClaimDetail]:
     )
     return api_response(data=detail, status_code=200)
 
-def create_claim_service(data: ClaimCreateRequest) -> APIResponse[ClaimCreateResponse]:
-    # TODO: Implement logic to create a new claim in the database or external service.
-    # Should validate the input, persist the claim, and return the created ClaimCreateResponse object.
-    response = ClaimCreateResponse(
-        id="CLM999",
-        claim_number="CLM999",
-        status="Open",
-        open_date=data.open_date or "2024-06-01",
-        description=data.description,
-        policy_id=data.policy_id,
-        contract_name="Home Insurance Basic" if data.policy_id == "HOM123" else "Auto Insurance Plus"
-    )
-    return api_response(data=response, status_code=201)
+# Stores the claim in the submission queue and answers 202 right away with the submission, whose status is
+# then read from GET /v1/claims/submissions/{id}. The claim is sent to the backend by submit_claim, in the
+# background (see claim_queue.py). With an Idempotency-Key, sending the same claim again returns the first
+# submission instead of creating another one.
+def create_claim_service(user_id: str, data: ClaimCreateRequest, idempotency_key: Optional[str] = None) -> APIResponse[ClaimSubmission]:
+    payload = {"description": data.description, "policy_id": data.policy_id, "open_date": data.open_date}
+    try:
+        stored, created = enqueue_submission(user_id, idempotency_key, payload)
+    except IdempotencyKeyReusedError as e:
+        return api_response(error=APIError(message=str(e), code="idempotency_key_reused"), status_code=422)
+    response = api_response(data=_submission(stored), status_code=202)
+    response.headers["Location"] = f"/v1/claims/submissions/{stored['id']}"
+    if not created:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
 
-def list_claims_service():
-    # Obtain a valid security context (SessionId and IsAuthenticated) for the SOAP request
-    sc = get_security_context()
-    # Create a SOAP client for the claims service
-    client = Client(CLAIM_SOAP_URL)
-    # Call the generic RunAction method on the SOAP backend
-    # - sc: the security context (authentication/session info)
-    # - name: the name of the action to execute (must be recognized by the backend)
-    # - params: additional parameters for the action (empty here, but can include filters)
-    result = client.service.RunAction(
-        sc=sc,
-        name="GetClaims",
-        params={}
+def _submission(stored: dict) -> ClaimSubmission:
+    return ClaimSubmission(
+        id=stored["id"],
+        status=stored["status"],
+        attempts=stored["attempts"],
+        claim=ClaimCreateResponse(**stored["result"]) if stored["result"] else None,
+        error=stored["error"] if stored["status"] == "failed" else None
     )
-    # Return the data field from the SOAP response, which should contain the list of claims
-    return result.Data  # Or adjust as needed based on the actual SOAP response structure 
\ No newline at end of file
+
+def get_claim_submission_service(user_id: str, id: str) -> APIResponse[ClaimSubmission]:
+    stored = get_submission(user_id, id)
+    if stored is None:
+        return api_response(error=APIError(message="Claim submission not found"), status_code=404)
+    return api_response(data=_submission(stored), status_code=200)
+
+# Sends a queued claim to the backend (called by the claim_queue workers, again after a failed attempt).
+# The submission id is sent along so the backend can recognize a claim it already created when an attempt
+# timed out after the claim was written.
+# Returns the created claim as a dict; a SOAP fault (the backend refused the claim) is not retried.
+def submit_claim(user_id: str, submission_id: str, payload: dict) -> dict:
+    from zeep.exceptions import Fault
+    from zeep.helpers import serialize_object
+    try:
+        result = run_action(CLAIM_SOAP_URL, "CreateClaim", action_params({"submission_id": submission_id, **payload}))
+    except Fault as e:
+        raise SubmissionRejectedError(e.message)
+    # The backend answers with the created claim (adjust as needed based on the actual SOAP response structure)
+    items = serialize_object(result.Data) or []
+    if not items:
+        raise SubmissionRejectedError("The backend did not return the created claim")
+    claim = ClaimCreateResponse(**items[0])
+    # The user's cached claim lists and details are now outdated; the new claim goes straight into their index
+    invalidate("claims", user_id)
+    claims_index.add(user_id, ClaimSummary(
+        id=claim.id,
+        claim_number=claim.claim_number,
+        status=claim.status,
+        open_date=claim.open_date,
+        description=claim.description,
+        policy_id=claim.policy_id,
+        contract_name=claim.contract_name
+    ))
+    return {field: getattr(claim, field) for field in ("id", "claim_number", "status", "open_date", "description", "policy_id", "contract_name")}
+
+# The params of GetClaims: the backend only returns the claims of this user.
+def _claims_params(user_id: str):
+    if not user_id:
+        raise ValueError("GetClaims needs the id of the user whose claims are listed")
+    return action_params({"user_id": user_id})
+
+# Loads the claims of the user (for claims_index and the claim status stream).
+# The RunAction call goes through the async transport, so the request does not hold a threadpool worker
+# while the backend answers, and it is shared with identical concurrent calls of the same user.
+async def load_claims(user_id: str) -> List[ClaimSummary]:
+    from zeep.helpers import serialize_object
+    result = await run_action_async(CLAIM_SOAP_URL, "GetClaims", _claims_params(user_id))
+    # Convert the zeep objects to plain dicts (adjust as needed based on the actual SOAP response structure)
+    return [ClaimSummary(**item) for item in serialize_object(result.Data) or []]
+
+# Claims are ordered from the most recent open_date; the claim id breaks ties so the cursor is unique.
+def _claim_sort_key(claim: ClaimSummary):
+    return (claim.open_date, claim.id)
+
+# Indexed snapshot of the claims of each user (see record_index.py).
+claims_index = create_record_index("claims", ("policy_id", "status", "type"), _claim_sort_key, load_claims)
+
+# Lists the claims of the user for the async /v1/claims endpoint.
+# The filters are answered from the user's claims_index, so one GetClaims call serves every combination of filters.
+# GetClaims takes no paging parameters, so the page window is applied to the matching claims.
+@cached("claims")
+async def list_claims_service_async(user_id: str, policy_id: Optional[str], status: Optional[str], type: Optional[str], page: int, page_size: int, cursor: Optional[str] = None, include_count: bool = True) -> APIResponse[List[ClaimSummary]]:
+    if CLAIMS_STREAMING_PARSE:
+        return await _list_claims_streaming(user_id, policy_id, status, type, page, page_size, cursor, include_count)
+    snapshot = await claims_index.get_async(user_id)
+    data = snapshot.select({"policy_id": policy_id, "status": status, "type": type}, reverse=True)
+    count = len(data) if include_count else None
+    try:
+        data, next_cursor = paginate(data, _claim_sort_key, page, page_size, cursor, reverse=True, presorted=True)
+    except InvalidCursorError as e:
+        return api_response(error=APIError(message=str(e)), status_code=400)
+    return api_response(data=data, count=count, next_cursor=next_cursor, status_code=200)
+
+# Streaming variant of list_claims_service_async: each <Data> record of the GetClaims response is filtered as soon
+# as it is parsed, and only the records that can still be part of the requested page are kept (PageWindow).
+# As in the default mode, a claim without a type does not match the type filter.
+async def _list_claims_streaming(user_id: str, policy_id: Optional[str], status: Optional[str], type: Optional[str], page: int, page_size: int, cursor: Optional[str], include_count: bool) -> APIResponse[List[ClaimSummary]]:
+    try:
+        window = PageWindow(lambda r: (r["open_date"], r["id"]), page, page_size, cursor, reverse=True)
+    except InvalidCursorError as e:
+        return api_response(error=APIError(message=str(e)), status_code=400)
+    matches = 0
+
+    def on_record(record):
+        nonlocal matches
+        if policy_id and record.get("policy_id") != policy_id:
+            return
+        if status and record.get("status") != status:
+            return
+        if type and record.get("type") != type:
+            return
+        matches += 1
+        window.add(record)
+
+    await stream_action_async(CLAIM_SOAP_URL, "GetClaims", _claims_params(user_id), "Data", on_record)
+    records, next_cursor = window.result()
+    data = [ClaimSummary(**record) for record in records]
+    return api_response(data=data, count=matches if include_count else None, next_cursor=next_cursor, status_code=200)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from fastapi.responses import StreamingResponse
+from app.services.claim_service import load_claims
+
+logger = logging.getLogger(__name__)
+
+# Claim status updates pushed over Server-Sent Events (GET /v1/claims/stream), instead of clients polling the lists.
+# One poller per process loads the claims of the users with an open stream every CLAIM_STREAM_POLL_INTERVAL
+# seconds (identical concurrent GetClaims calls are shared, see soap_actions.py), compares them with the
+# previous poll and sends only the changes to the streams of the user:
+#   event: claim_added / claim_updated   data: the claim (ClaimSummary fields)
+#   event: claim_removed                 data: {"id": ...}
+#   event: reset                         data: {} - the changes since Last-Event-ID are not known: reload the claims
+# Every event has an id. A client that reconnects with Last-Event-ID gets the events it missed, as long as they
+# are still in the history of the process and its claims were still watched (CLAIM_STREAM_RESUME_WINDOW).
+
+# Seconds between two polls of the backend.
+CLAIM_STREAM_POLL_INTERVAL = float(os.environ.get("CLAIM_STREAM_POLL_INTERVAL", 10))
+# GetClaims calls of the poller in flight at once, kept well below SOAP_MAX_CONCURRENCY so the interactive
+# requests still find free slots in the SOAP bulkhead. With many watched users a poll then takes longer than
+# CLAIM_STREAM_POLL_INTERVAL, and the next one starts right after it.
+CLAIM_STREAM_POLL_CONCURRENCY = int(os.environ.get("CLAIM_STREAM_POLL_CONCURRENCY", 4))
+# Seconds without events after which a comment is sent, so proxies and clients keep the connection open.
+CLAIM_STREAM_HEARTBEAT = float(os.environ.get("CLAIM_STREAM_HEARTBEAT", 15))
+# Events kept per process to resume streams with Last-Event-ID.
+CLAIM_STREAM_HISTORY = int(os.environ.get("CLAIM_STREAM_HISTORY", 1000))
+# Seconds the claims of a user are still watched after their last stream closed, so a reconnection can resume.
+CLAIM_STREAM_RESUME_WINDOW = float(os.environ.get("CLAIM_STREAM_RESUME_WINDOW", 120))
+# Events waiting to be sent on a stream after which the client is considered too slow: its stream is closed
+# and it resumes from Last-Event-ID when it reconnects.
+CLAIM_STREAM_QUEUE_SIZE = int(os.environ.get("CLAIM_STREAM_QUEUE_SIZE", 100))
+# Seconds after which a stream is closed, so the client reconnects and its token is checked again.
+CLAIM_STREAM_MAX_DURATION = float(os.environ.get("CLAIM_STREAM_MAX_DURATION", 3600))
+# Milliseconds the clients wait before reconnecting (sent in the "retry" field).
+CLAIM_STREAM_RETRY_MS = int(os.environ.get("CLAIM_STREAM_RETRY_MS", 3000))
+
+# Event ids are "<epoch>-<sequence>". The epoch changes with every process: an id from another process
+# (or from before a restart) cannot be resumed.
+_EPOCH = uuid.uuid4().hex[:8]
+
+def _claim_dict(claim) -> dict:
+    return claim.model_dump() if hasattr(claim, "model_dump") else claim.dict()
+
+def _format(event_id, event: str, data: str) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+# One open stream. The queue receives (event id, event, data) tuples, or None when the stream must close.
+class _Subscription:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue = asyncio.Queue()
+
+class ClaimStreamHub:
+    def __init__(self, load):
+        self.load = load
+        # {user_id: {claim_id: claim dict}} as of the last poll, for every watched user
+        self._states = {}
+        # {user_id: set of _Subscription}
+        self._subscribers = {}
+        # {user_id: time.monotonic() when their last stream closed}
+        self._released = {}
+        # (sequence, user_id, event id, event, data), oldest first
+        self._history = deque(maxlen=CLAIM_STREAM_HISTORY)
+        self._sequence = 0
+        self._poller = None
+        self.stats = {"polls": 0, "poll_errors": 0, "events": 0, "slow_clients": 0}
+
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    # The events of the user after last_event_id, or a reset event when some of them may be missing.
+    def _backlog(self, user_id: str, last_event_id: str, watched: bool):
+        epoch, _, sequence = last_event_id.partition("-")
+        try:
+            sequence = int(sequence)
+        except ValueError:
+            sequence = None
+        complete = (watched and epoch == _EPOCH and sequence is not None and sequence <= self._sequence
+                    and (sequence == self._sequence or (self._history and self._history[0][0] <= sequence + 1)))
+        if not complete:
+            return [(None, "reset", "{}")]
+        return [(event_id, event, data) for seq, user, event_id, event, data in self._history
+                if user == user_id and seq > sequence]
+
+    # Opens a stream for the user. The first stream of a user loads their claims, the reference for the next poll.
+    async def subscribe(self, user_id: str, last_event_id=None):
+        watched = user_id in self._states
+        if not watched:
+            claims = await self.load(user_id)
+            self._states.setdefault(user_id, {claim.id: _claim_dict(claim) for claim in claims})
+        subscription = _Subscription(user_id)
+        backlog = self._backlog(user_id, last_event_id, watched) if last_event_id else []
+        for entry in backlog:
+            subscription.queue.put_nowait(entry)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self._released.pop(user_id, None)
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: _Subscription):
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscribers[subscription.user_id]
+            self._released[subscription.user_id] = time.monotonic()
+
+    def _publish(self, user_id: str, event: str, data: dict):
+        self._sequence += 1
+        event_id = f"{_EPOCH}-{self._sequence}"
+        entry = (event_id, event, json.dumps(data))
+        self._history.append((self._sequence, user_id) + entry)
+        self.stats["events"] += 1
+        for subscription in list(self._subscribers.get(user_id, ())):
+            if subscription.queue.qsize() >= CLAIM_STREAM_QUEUE_SIZE:
+                self.stats["slow_clients"] += 1
+                self.unsubscribe(subscription)
+                subscription.queue.put_nowait(None)
+            else:
+                subscription.queue.put_nowait(entry)
+
+    # Compares the claims of the user with the previous poll and publishes the differences.
+    def _apply(self, user_id: str, claims):
+        previous = self._states[user_id]
+        current = {claim.id: _claim_dict(claim) for claim in claims}
+        for id, claim in current.items():
+            if id not in previous:
+                self._publish(user_id, "claim_added", claim)
+            elif previous[id] != claim:
+                self._publish(user_id, "claim_updated", claim)
+        for id in previous.keys() - current.keys():
+            self._publish(user_id, "claim_removed", {"id": id})
+        self._states[user_id] = current
+
+    # Stops watching the users whose last stream closed more than CLAIM_STREAM_RESUME_WINDOW ago.
+    def _expire(self):
+        now = time.monotonic()
+        for user_id, released_at in list(self._released.items()):
+            if now - released_at >= CLAIM_STREAM_RESUME_WINDOW:
+                del self._released[user_id]
+                self._states.pop(user_id, None)
+
+    # Loads the claims of every watched user, spread over the poll interval and at most
+    # CLAIM_STREAM_POLL_CONCURRENCY at a time, instead of all at once.
+    async def _poll(self):
+        users = list(self._states)
+        semaphore = asyncio.Semaphore(CLAIM_STREAM_POLL_CONCURRENCY)
+        spacing = CLAIM_STREAM_POLL_INTERVAL / len(users) if users else 0
+
+        async def poll_user(position: int, user_id: str):
+            await asyncio.sleep(position * spacing)
+            async with semaphore:
+                if user_id not in self._states:
+                    return
+                try:
+                    claims = await self.load(user_id)
+                except Exception as e:
+                    # The next poll compares with the last known claims
+                    self.stats["poll_errors"] += 1
+                    logger.warning(f"Claim stream poll failed for a user: {e}")
+                    return
+            if user_id in self._states:
+                self._apply(user_id, claims)
+
+        await asyncio.gather(*(poll_user(position, user_id) for position, user_id in enumerate(users)))
+        self.stats["polls"] += 1
+
+    # Runs while some users are watched. A poll starts every CLAIM_STREAM_POLL_INTERVAL seconds,
+    # or as soon as the previous one ends if it took longer.
+    async def _run(self):
+        try:
+            next_poll = time.monotonic() + CLAIM_STREAM_POLL_INTERVAL
+            while True:
+                await asyncio.sleep(max(0, next_poll - time.monotonic()))
+                next_poll = time.monotonic() + CLAIM_STREAM_POLL_INTERVAL
+                self._expire()
+                if not self._states:
+                    break
+                try:
+                    await self._poll()
+                except Exception as e:
+                    self.stats["poll_errors"] += 1
+                    logger.error(f"Claim stream poll failed: {e}")
+        finally:
+            self._poller = None
+
+    # Stops the poller and closes the open streams (called when the worker stops).
+    def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+        for subscriptions in list(self._subscribers.values()):
+            for subscription in list(subscriptions):
+                self.unsubscribe(subscription)
+                subscription.queue.put_nowait(None)
+
+    # The text/event-stream body of one stream.
+    async def events(self, subscription: _Subscription):
+        deadline = time.monotonic() + CLAIM_STREAM_MAX_DURATION
+        try:
+            yield f"retry: {CLAIM_STREAM_RETRY_MS}\n\n"
+            while True:
+                timeout = min(CLAIM_STREAM_HEARTBEAT, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(subscription.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if entry is None:
+                    break
+                yield _format(*entry)
+        finally:
+            self.unsubscribe(subscription)
+
+claim_stream = ClaimStreamHub(load_claims)
+
+async def stream_claims_service(user_id: str, last_event_id=None):
+    subscription = await claim_stream.subscribe(user_id, last_event_id)
+    # no-transform: not compressed (see app/middleware/compression.py), nor buffered by proxies
+    headers = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    return StreamingResponse(claim_stream.events(subscription), media_type="text/event-stream", headers=headers)
+
+# For the metrics.
+def get_claim_stream_stats():
+    return dict(claim_stream.stats, subscribers=claim_stream.subscribers(), watched_users=len(claim_stream._states))
@@ -0,0 +1,64 @@
+import os
+import asyncio
+import logging
+import orjson
+from starlette.concurrency import run_in_threadpool
+from app.models.base import APIError, api_response
+from app.services.auth_service import user_response
+from app.services.policy_service import list_policies_service
+from app.services.claim_service import list_claims_service_async
+from app.services.document_service import list_documents_service
+from app.services.resilience import BackendUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a dashboard section may take before it is returned as an error, so one slow backend
+# cannot hold the whole page.
+DASHBOARD_SECTION_TIMEOUT = float(os.environ.get("DASHBOARD_SECTION_TIMEOUT", 10))
+
+# Turns the response of a list service into a dashboard section (its envelope, plus the stale flag).
+def _section(response) -> dict:
+    section = orjson.loads(response.body)
+    section["stale"] = response.headers.get("x-cache-status") == "stale"
+    return section
+
+def _error_section(message: str, status_code: int, code: str = None, details: str = None) -> dict:
+    return {
+        "data": None,
+        "error": APIError(message=message, details=details, code=code),
+        "count": None,
+        "status_code": status_code,
+        "next_cursor": None,
+        "stale": False,
+    }
+
+# Runs one section; its errors are returned in the section instead of failing the whole dashboard.
+async def _run_section(name: str, call) -> dict:
+    try:
+        return _section(await asyncio.wait_for(call, DASHBOARD_SECTION_TIMEOUT))
+    except asyncio.TimeoutError:
+        return _error_section(f"{name} took too long to load", 504, code="timeout")
+    except BackendUnavailableError as e:
+        return _error_section("Service temporarily unavailable, please try again later", e.status_code, code=e.reason, details=str(e))
+    except Exception as e:
+        logger.exception(f"Dashboard section {name} failed: {e}")
+        return _error_section("Internal Server Error", 500, code="internal_error")
+
+# Builds the landing page data for an already validated user: the profile plus the first page of
+# policies, claims and documents. The three lists are fetched concurrently, so the response takes as long
+# as the slowest of them instead of their sum.
+async def get_dashboard_service(user: dict, page_size: int):
+    user_id = user["id"]
+    # Same arguments as the list endpoints without filters, so both share the cached responses
+    policies, claims, documents = await asyncio.gather(
+        _run_section("policies", run_in_threadpool(list_policies_service, user_id, None, None, 1, page_size, None, True)),
+        _run_section("claims", list_claims_service_async(user_id, None, None, None, 1, page_size, None, True)),
+        _run_section("documents", run_in_threadpool(list_documents_service, user_id, None, None, None, None, None, 1, page_size, None, True)),
+    )
+    data = {
+        "user": user_response(user),
+        "policies": policies,
+        "claims": claims,
+        "documents": documents,
+    }
+    return api_response(data=data, status_code=200)
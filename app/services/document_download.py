@@ -0,0 +1,80 @@
+import re
+from email.utils import formatdate
+from urllib.parse import quote
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.requests import Request
+from app.services.document_storage import get_storage
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+# Parses a single-range "Range: bytes=start-end" header for a file of `size` bytes.
+# Returns (start, end) inclusive, or None to send the whole file (no header, or a form we do not support).
+def parse_range(header: str, size: int):
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def _content_disposition(filename: str) -> str:
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+# Streams an object of a remote storage backend, honouring Range/If-Range.
+# Chunks are read in a worker thread one at a time, so a slow download does not hold a thread for its whole duration.
+async def _stream_remote(request: Request, storage, key: str, media_type: str, filename: str):
+    stat = await run_in_threadpool(storage.stat, key)
+    if stat is None:
+        return None
+    size = stat["size"]
+    last_modified = formatdate(stat["last_modified"], usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": stat["etag"],
+        "last-modified": last_modified,
+        "content-disposition": _content_disposition(filename),
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only send the range if the client's copy is still the current one, otherwise send everything
+    if range_header and if_range and if_range not in (stat["etag"], last_modified):
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    if byte_range is None or size == 0:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+    headers["content-length"] = str(end - start + 1) if size else "0"
+    content = iterate_in_threadpool(storage.iter_range(key, start, end)) if size else iter([])
+    return StreamingResponse(content, status_code=status_code, media_type=media_type, headers=headers)
+
+# Returns a response with the bytes of a stored document, or None if the file does not exist.
+# Local files go through FileResponse, which supports Range/If-Range, ETag/Last-Modified and zero-copy
+# sending when the ASGI server implements the pathsend extension; remote files are streamed in chunks.
+async def document_file_response(request: Request, key: str, media_type: str, filename: str, etag: str = None):
+    storage = get_storage()
+    path = await run_in_threadpool(storage.local_path, key)
+    if path is not None:
+        headers = {"etag": f'"{etag}"'} if etag else None
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    if hasattr(storage, "stat"):
+        return await _stream_remote(request, storage, key, media_type, filename)
+    return None
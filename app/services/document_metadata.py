@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+# SQLite database holding the metadata of the uploaded documents (the files themselves are in the document storage).
+# Documents with the same content share one file (blob): the blobs table counts the documents referencing each
+# blob, and is updated in the same transaction as the documents, so the count always matches the metadata.
+DOCUMENT_DB_PATH = os.path.abspath(os.environ.get("DOCUMENT_DB_PATH", "./storage/documents.db"))
+
+_COLUMNS = ["id", "user_id", "name", "category", "policy_id", "claim_id", "billing", "type",
+            "storage_key", "filename", "content_type", "size", "sha256", "created_at"]
+
+# One connection per thread: sqlite3 connections cannot be shared between threads.
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def _connect():
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DOCUMENT_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DOCUMENT_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        id TEXT PRIMARY KEY,
+                        user_id TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        category TEXT NOT NULL,
+                        policy_id TEXT,
+                        claim_id TEXT,
+                        billing TEXT,
+                        type TEXT NOT NULL,
+                        storage_key TEXT NOT NULL,
+                        filename TEXT,
+                        content_type TEXT,
+                        size INTEGER NOT NULL,
+                        sha256 TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS documents_user_id ON documents (user_id)")
+                conn.execute("CREATE INDEX IF NOT EXISTS documents_user_sha256 ON documents (user_id, sha256)")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        sha256 TEXT PRIMARY KEY,
+                        storage_key TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        refcount INTEGER NOT NULL
+                    )
+                """)
+                conn.commit()
+                _initialized = True
+    return conn
+
+# Stores the metadata of a new document and takes a reference on the blob of its content.
+# `document` is a dict with the keys of _COLUMNS (created_at is optional; storage_key is set here).
+# When no blob with this sha256 exists yet, store_blob() is called to store the file and returns its key.
+# Returns True if the blob was created, False if the document shares an existing one.
+# The blob lookup, store_blob() and the writes run under the database write lock (BEGIN IMMEDIATE), so a
+# concurrent delete_document cannot remove a blob that is being referenced again.
+def save_document(document: dict, store_blob=None) -> bool:
+    row = dict(document)
+    row.setdefault("created_at", time.time())
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        blob = conn.execute("SELECT storage_key FROM blobs WHERE sha256 = ?", (row["sha256"],)).fetchone()
+        created = blob is None
+        if created:
+            if store_blob is None:
+                raise LookupError(f"No stored file with sha256 {row['sha256']}")
+            row["storage_key"] = store_blob()
+            conn.execute("INSERT INTO blobs (sha256, storage_key, size, refcount) VALUES (?, ?, ?, 1)",
+                         (row["sha256"], row["storage_key"], row["size"]))
+        else:
+            row["storage_key"] = blob["storage_key"]
+            conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (row["sha256"],))
+        conn.execute(
+            f"INSERT INTO documents ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})",
+            [row.get(c) for c in _COLUMNS]
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    document["storage_key"] = row["storage_key"]
+    return created
+
+# Deletes the metadata of one of the user's documents and releases its blob. The last reference calls
+# delete_blob(storage_key), under the write lock like save_document. Returns the deleted document, or None.
+def delete_document(user_id: str, id: str, delete_blob):
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM documents WHERE id = ? AND user_id = ?", (id, user_id)).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute("DELETE FROM documents WHERE id = ?", (id,))
+        blob = conn.execute("SELECT storage_key, refcount FROM blobs WHERE sha256 = ?", (row["sha256"],)).fetchone()
+        if blob is None or blob["storage_key"] != row["storage_key"]:
+            # Stored before the blobs table: the document has its own file
+            delete_blob(row["storage_key"])
+        elif blob["refcount"] <= 1:
+            conn.execute("DELETE FROM blobs WHERE sha256 = ?", (row["sha256"],))
+            delete_blob(row["storage_key"])
+        else:
+            conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", (row["sha256"],))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return dict(row)
+
+# Returns one of the user's documents with the given content, or None. Only the user's own documents are
+# looked up: telling a user that someone else stored a file would reveal that file exists.
+def find_user_document_by_sha256(user_id: str, sha256: str):
+    row = _connect().execute("SELECT * FROM documents WHERE user_id = ? AND sha256 = ? LIMIT 1", (user_id, sha256)).fetchone()
+    return dict(row) if row else None
+
+# Total size in bytes of the user's documents, counting shared blobs for every document that uses them.
+def user_usage(user_id: str) -> int:
+    return _connect().execute("SELECT COALESCE(SUM(size), 0) FROM documents WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+# Returns the metadata of one of the user's documents as a dict, or None.
+def get_document(user_id: str, id: str):
+    row = _connect().execute("SELECT * FROM documents WHERE id = ? AND user_id = ?", (id, user_id)).fetchone()
+    return dict(row) if row else None
+
+# Returns the metadata of all the user's documents, oldest first.
+def list_user_documents(user_id: str):
+    rows = _connect().execute("SELECT * FROM documents WHERE user_id = ? ORDER BY created_at", (user_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+# Stored blobs, documents referencing them, and the bytes that deduplication avoided storing, for the metrics.
+# None until the store has been opened in this process, so a metrics scrape never creates the database.
+def get_blob_stats():
+    if not _initialized:
+        return None
+    row = _connect().execute(
+        "SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size), 0), COALESCE(SUM(size * (refcount - 1)), 0) FROM blobs"
+    ).fetchone()
+    return {"blobs": row[0], "references": row[1], "stored_bytes": row[2], "saved_bytes": row[3]}
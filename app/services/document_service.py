@@ -1,13 +1,29 @@
-from app.models.base import APIResponse, api_response
+from app.models.base import APIResponse, APIError, api_response
 from app.models.document import DocumentSummary, DocumentDetail, DocumentUploadResponse
 from typing import List, Optional
-from fastapi import UploadFile
+import uuid
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from app.services.response_cache import cached, invalidate
+from app.services.pagination import paginate, InvalidCursorError
+from app.services.document_upload import receive_upload, UploadError, DOCUMENT_MAX_USER_BYTES
+from app.services.document_metadata import save_document, get_document, list_user_documents, delete_document, find_user_document_by_sha256, user_usage
+from app.services.document_storage import get_storage, blob_key
+from app.services.record_index import create_record_index
+from app.services.document_download import document_file_response
 
-def list_documents_service(policy_id: Optional[str], claim_id: Optional[str], billing: Optional[str], type: Optional[str], category: Optional[str], page: int, page_size: int) -> APIResponse[List[DocumentSummary]]:
-    # TODO: Implement logic to fetch and filter documents from the database or external service.
-    # Should support filtering by policy_id, claim_id, billing, type, category, and pagination (page, page_size).
-    # Return a list of DocumentSummary objects and the total count.
-    data = [
+# URL where the bytes of a stored document are served (see download_document_service).
+def _download_url(id: str) -> str:
+    return f"/v1/documents/{id}?download=true"
+
+# Summary of a document stored by document_metadata.
+def _summary(stored: dict) -> DocumentSummary:
+    return DocumentSummary(**{k: stored[k] for k in ("id", "name", "category", "policy_id", "claim_id", "billing", "type")})
+
+# Loads the documents of the user for documents_index: the uploaded ones, plus the mocked ones.
+def _load_documents(user_id: str) -> List[DocumentSummary]:
+    # TODO: Implement logic to fetch the documents from the database or external service.
+    mocked = [
         DocumentSummary(
             id="DOC001",
             name="Policy Contract.pdf",
@@ -27,9 +43,32 @@ def list_documents_service(policy_id: Optional[str], claim_id: Optional[str], bi
             type="pdf"
         )
     ]
-    return api_response(data=data, count=len(data), status_code=200)
+    return mocked + [_summary(stored) for stored in list_user_documents(user_id)]
+
+# Documents are ordered by id.
+def _document_sort_key(document: DocumentSummary):
+    return (document.id,)
+
+# Indexed snapshot of the documents of each user, with a hash index per filter (see record_index.py).
+documents_index = create_record_index("documents", ("policy_id", "claim_id", "billing", "type", "category"), _document_sort_key, _load_documents)
 
-def get_document_service(id: str) -> APIResponse[DocumentDetail]:
+@cached("documents")
+def list_documents_service(user_id: str, policy_id: Optional[str], claim_id: Optional[str], billing: Optional[str], type: Optional[str], category: Optional[str], page: int, page_size: int, cursor: Optional[str] = None, include_count: bool = True) -> APIResponse[List[DocumentSummary]]:
+    snapshot = documents_index.get(user_id)
+    data = snapshot.select({"policy_id": policy_id, "claim_id": claim_id, "billing": billing, "type": type, "category": category})
+    count = len(data) if include_count else None
+    try:
+        data, next_cursor = paginate(data, _document_sort_key, page, page_size, cursor, presorted=True)
+    except InvalidCursorError as e:
+        return api_response(error=APIError(message=str(e)), status_code=400)
+    return api_response(data=data, count=count, next_cursor=next_cursor, status_code=200)
+
+@cached("documents")
+def get_document_service(user_id: str, id: str) -> APIResponse[DocumentDetail]:
+    stored = get_document(user_id, id)
+    if stored:
+        detail = DocumentDetail(**{k: stored[k] for k in ("id", "name", "category", "policy_id", "claim_id", "billing", "type")}, url=_download_url(id))
+        return api_response(data=detail, status_code=200)
     # TODO: Implement logic to fetch a specific document by its ID from the database or external service.
     # Should return a DocumentDetail object if found, or an appropriate error if not found.
     detail = DocumentDetail(
@@ -44,17 +83,95 @@ def get_document_service(id: str) -> APIResponse[DocumentDetail]:
     )
     return api_response(data=detail, status_code=200)
 
-def upload_document_service(file: UploadFile, name: str, category: str, policy_id: Optional[str], claim_id: Optional[str], billing: Optional[str], type: str) -> APIResponse[DocumentUploadResponse]:
-    # TODO: Implement logic to handle document upload, save the file, and persist metadata in the database or external service.
-    # Should return the created DocumentUploadResponse object with the file URL.
+# Stores an uploaded document and returns its metadata. Files are stored once per content (content-addressed):
+# - with sha256 (the SHA-256 the client computed), a file the user already stored is not uploaded again:
+#   the answer comes before the body is read (with "Expect: 100-continue" the client does not even send it);
+# - otherwise the file is streamed to a temporary key (see document_upload.receive_upload) while it is hashed,
+#   then becomes the blob of its content, or is dropped if that blob already exists (only the metadata is written).
+async def upload_document_service(user_id: str, request: Request, name: str, category: str, policy_id: Optional[str], claim_id: Optional[str], billing: Optional[str], type: str, sha256: Optional[str] = None) -> APIResponse[DocumentUploadResponse]:
+    document_id = f"DOC{uuid.uuid4().hex[:12].upper()}"
+    sha256 = sha256.lower() if sha256 else None
+    storage = get_storage()
+    document = {
+        "id": document_id,
+        "user_id": user_id,
+        "name": name,
+        "category": category,
+        "policy_id": policy_id,
+        "claim_id": claim_id,
+        "billing": billing,
+        "type": type
+    }
+    existing = await run_in_threadpool(find_user_document_by_sha256, user_id, sha256) if sha256 else None
+    if existing:
+        if await run_in_threadpool(user_usage, user_id) + existing["size"] > DOCUMENT_MAX_USER_BYTES:
+            return api_response(error=APIError(message="Document storage quota exceeded"), status_code=413)
+        document.update(size=existing["size"], sha256=sha256, filename=name, content_type=existing["content_type"])
+        try:
+            await run_in_threadpool(save_document, document)
+        except LookupError:
+            # Deleted meanwhile, or stored before the blobs table: the file is uploaded after all
+            existing = None
+    if not existing:
+        upload_key = f"uploads/{document_id}"
+        try:
+            stored = await receive_upload(request, user_id, upload_key)
+        except UploadError as e:
+            return api_response(error=APIError(message=e.message), status_code=e.status_code)
+        if sha256 and stored.sha256 != sha256:
+            await run_in_threadpool(storage.delete, upload_key)
+            return api_response(error=APIError(message="The file does not match the sha256 parameter"), status_code=400)
+        document.update(size=stored.size, sha256=stored.sha256, filename=stored.filename or name, content_type=stored.content_type)
+
+        def store_blob():
+            key = blob_key(stored.sha256)
+            storage.move(upload_key, key)
+            return key
+        if not await run_in_threadpool(save_document, document, store_blob):
+            # Same content as an existing blob: only the metadata is stored
+            await run_in_threadpool(storage.delete, upload_key)
     response = DocumentUploadResponse(
-        id="DOC999",
+        id=document_id,
         name=name,
         category=category,
         policy_id=policy_id,
         claim_id=claim_id,
         billing=billing,
         type=type,
-        url=f"https://example.com/documents/DOC999.pdf"
+        url=_download_url(document_id),
+        size=document["size"],
+        sha256=document["sha256"]
     )
-    return api_response(data=response, status_code=201) 
\ No newline at end of file
+    # The user's cached document lists and details are now outdated; the new document goes straight into their index
+    invalidate("documents", user_id)
+    documents_index.add(user_id, DocumentSummary(
+        id=document_id,
+        name=name,
+        category=category,
+        policy_id=policy_id,
+        claim_id=claim_id,
+        billing=billing,
+        type=type
+    ))
+    return api_response(data=response, status_code=201)
+
+# Deletes one of the user's uploaded documents. Its file is deleted with the last document using it.
+async def delete_document_service(user_id: str, id: str):
+    storage = get_storage()
+    deleted = await run_in_threadpool(delete_document, user_id, id, storage.delete)
+    if deleted is None:
+        return api_response(error=APIError(message="Document not found"), status_code=404)
+    invalidate("documents", user_id)
+    documents_index.remove(user_id, id)
+    return api_response(status_code=200)
+
+# Serves the bytes of one of the user's documents, with Range/If-Range and ETag/Last-Modified support
+# (see document_download.document_file_response).
+async def download_document_service(user_id: str, id: str, request: Request):
+    stored = await run_in_threadpool(get_document, user_id, id)
+    response = None
+    if stored:
+        response = await document_file_response(request, stored["storage_key"], stored["content_type"], stored["filename"], stored["sha256"])
+    if response is None:
+        return api_response(error=APIError(message="Document file not found"), status_code=404)
+    return response
@@ -0,0 +1,153 @@
+import os
+import uuid
+from dotenv import load_dotenv
+load_dotenv()
+
+# Storage for the document files.
+# "local" (default): files under DOCUMENT_STORAGE_PATH on the server's disk.
+# "s3": any S3-compatible object storage (requires the boto3 package).
+DOCUMENT_STORAGE_BACKEND = os.environ.get("DOCUMENT_STORAGE_BACKEND", "local")
+DOCUMENT_STORAGE_PATH = os.environ.get("DOCUMENT_STORAGE_PATH", "./storage/documents")
+DOCUMENT_S3_BUCKET = os.environ.get("DOCUMENT_S3_BUCKET")
+# Endpoint of the S3-compatible service (leave empty for AWS S3).
+DOCUMENT_S3_ENDPOINT_URL = os.environ.get("DOCUMENT_S3_ENDPOINT_URL")
+
+# Writers receive the file in chunks and only make it visible once commit() is called,
+# so an aborted or rejected upload never leaves a partial file behind.
+
+# Files are stored once per content (content-addressed): under the key of their SHA-256, shared by every
+# document with the same bytes (see document_metadata.save_document for the reference counting).
+def blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+class LocalFileWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class LocalStorageBackend:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("Invalid storage key")
+        return path
+
+    def open_writer(self, key: str) -> LocalFileWriter:
+        return LocalFileWriter(self._path(key))
+
+    # Local files are served directly from their path (FileResponse, zero-copy when the server supports it).
+    def local_path(self, key: str):
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def delete(self, key: str):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Renames a stored file (e.g. an upload to its blob key).
+    def move(self, src: str, dst: str):
+        path = self._path(dst)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._path(src), path)
+
+class S3FileWriter:
+    # S3 multipart parts must be at least 5 MiB (except the last one), so data is buffered up to that size.
+    PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def _upload_part(self):
+        number = len(self._parts) + 1
+        res = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=number, Body=bytes(self._buffer))
+        self._parts.append({"ETag": res["ETag"], "PartNumber": number})
+        self._buffer.clear()
+
+    def write(self, chunk: bytes):
+        self._buffer += chunk
+        if len(self._buffer) >= self.PART_SIZE:
+            self._upload_part()
+
+    def commit(self):
+        if self._buffer or not self._parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts})
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+class S3StorageBackend:
+    def __init__(self, bucket: str, endpoint_url: str = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("DOCUMENT_STORAGE_BACKEND=s3 requires the boto3 package (pip install boto3)")
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def open_writer(self, key: str) -> S3FileWriter:
+        return S3FileWriter(self.client, self.bucket, key)
+
+    # Remote objects have no local path; they are streamed with stat() and iter_range().
+    def local_path(self, key: str):
+        return None
+
+    # Returns {"size", "etag", "last_modified" (timestamp)} of the object, or None if it does not exist.
+    def stat(self, key: str):
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError:
+            return None
+        return {"size": head["ContentLength"], "etag": head["ETag"], "last_modified": head["LastModified"].timestamp()}
+
+    # Yields the bytes start..end (inclusive) of the object in chunks of chunk_size.
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int = 64 * 1024):
+        body = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    # S3 cannot rename: the object is copied on the server side, then deleted.
+    def move(self, src: str, dst: str):
+        self.client.copy_object(Bucket=self.bucket, Key=dst, CopySource={"Bucket": self.bucket, "Key": src})
+        self.client.delete_object(Bucket=self.bucket, Key=src)
+
+_storage = None
+
+# Returns the configured storage backend, created on first use.
+def get_storage():
+    global _storage
+    if _storage is None:
+        if DOCUMENT_STORAGE_BACKEND == "s3":
+            _storage = S3StorageBackend(DOCUMENT_S3_BUCKET, DOCUMENT_S3_ENDPOINT_URL)
+        else:
+            _storage = LocalStorageBackend(DOCUMENT_STORAGE_PATH)
+    return _storage
@@ -0,0 +1,145 @@
+import os
+import hashlib
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from app.services.document_storage import get_storage
+from app.services.document_metadata import user_usage
+
+# Maximum size (in bytes) of one uploaded file.
+DOCUMENT_MAX_FILE_SIZE = int(os.environ.get("DOCUMENT_MAX_FILE_SIZE", 25 * 1024 * 1024))
+# Maximum total size (in bytes) of the files stored for one user.
+DOCUMENT_MAX_USER_BYTES = int(os.environ.get("DOCUMENT_MAX_USER_BYTES", 500 * 1024 * 1024))
+# Size (in bytes) of the chunks handed to the storage backend. At most about one chunk per upload is held in memory.
+DOCUMENT_UPLOAD_CHUNK_SIZE = int(os.environ.get("DOCUMENT_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Allowance for the multipart boundaries, part headers and small form fields around the file.
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+# Result of a stored upload: where the file is, its size, its SHA-256 and what the client said it was.
+class StoredUpload:
+    def __init__(self, key: str, size: int, sha256: str, filename: str, content_type: str):
+        self.key = key
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+# Streaming multipart parser state for the "file" field: the part data is hashed, counted and buffered
+# as it arrives, and the caller drains the buffer to the storage writer every DOCUMENT_UPLOAD_CHUNK_SIZE bytes.
+class _FilePartReceiver:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.filename = None
+        self.content_type = None
+        self.found = False
+        self._in_file = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Only the first part named "file" is stored; other fields are ignored
+        if options.get(b"name") == b"file" and not self.found:
+            self.found = True
+            self._in_file = True
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            chunk = data[start:end]
+            self.buffer += chunk
+            self.digest.update(chunk)
+            self.size += len(chunk)
+
+    def _on_part_end(self):
+        self._in_file = False
+
+# Streams the multipart body of the request to storage under `key`, without holding the whole file in memory.
+# The per-file and per-user limits (the user's usage is the total size of their documents, see
+# document_metadata.user_usage) are checked against Content-Length before anything is read,
+# then again while the body arrives, so an oversized upload is rejected as soon as it crosses the limit.
+async def receive_upload(request: Request, user_id: str, key: str) -> StoredUpload:
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data body with a file field")
+
+    storage = get_storage()
+    used = await run_in_threadpool(user_usage, user_id)
+    limit = min(DOCUMENT_MAX_FILE_SIZE, DOCUMENT_MAX_USER_BYTES - used)
+    if limit <= 0:
+        raise UploadError("Document storage quota exceeded", 413)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit + MULTIPART_OVERHEAD:
+        raise UploadError(f"File too large (limit {limit} bytes)", 413)
+
+    receiver = _FilePartReceiver()
+    parser = MultipartParser(boundary, receiver.callbacks())
+    writer = await run_in_threadpool(storage.open_writer, key)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise UploadError("Malformed multipart body")
+            if receiver.size > limit or received > limit + MULTIPART_OVERHEAD:
+                raise UploadError(f"File too large (limit {limit} bytes)", 413)
+            if len(receiver.buffer) >= DOCUMENT_UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(writer.write, bytes(receiver.buffer))
+                receiver.buffer.clear()
+        try:
+            parser.finalize()
+        except MultipartParseError:
+            raise UploadError("Malformed multipart body")
+        if not receiver.found:
+            raise UploadError("Missing file field")
+        if receiver.buffer:
+            await run_in_threadpool(writer.write, bytes(receiver.buffer))
+            receiver.buffer.clear()
+        await run_in_threadpool(writer.commit)
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
+    return StoredUpload(key, receiver.size, receiver.digest.hexdigest(), receiver.filename, receiver.content_type)
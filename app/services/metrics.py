@@ -0,0 +1,216 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Prometheus metrics of the API: incoming requests per route and outgoing calls per backend operation.
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR to a shared empty directory so that
+# /v1/metrics reports the sum of all workers instead of the worker that happened to answer.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Latency buckets (in seconds), from cache hits to slow SOAP actions.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled, by route and status code.",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, by route.",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled, by route.",
+    ["method", "route"], multiprocess_mode="livesum"
+)
+BACKEND_CALL_DURATION = Histogram(
+    "backend_call_duration_seconds",
+    "Time of the calls to the Supabase and SOAP backends, by operation (and action name for RunAction).",
+    ["backend", "operation", "action", "outcome"], buckets=LATENCY_BUCKETS
+)
+BACKEND_REJECTIONS = Counter(
+    "backend_rejections_total",
+    "Backend calls not sent or abandoned: circuit_open, bulkhead_full or timeout.",
+    ["backend", "reason"]
+)
+STARTUP_PHASE_DURATION = Gauge(
+    "startup_phase_seconds",
+    "Time spent in each startup phase of the worker: imports, and each warm-up step (see app/services/warmup.py).",
+    ["phase"], multiprocess_mode="max"
+)
+
+# Labelled children already created, so the hot path does not go through metric.labels() every time.
+_children = {}
+
+def _child(metric, labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    _child(HTTP_REQUESTS, (method, route, str(status))).inc()
+    _child(HTTP_REQUEST_DURATION, (method, route)).observe(seconds)
+
+def request_in_flight(method: str, route: str):
+    return _child(HTTP_REQUESTS_IN_FLIGHT, (method, route))
+
+def observe_backend_call(backend: str, operation: str, seconds: float, outcome: str = "ok", action: str = ""):
+    _child(BACKEND_CALL_DURATION, (backend, operation, action, outcome)).observe(seconds)
+
+def observe_backend_rejection(backend: str, reason: str):
+    _child(BACKEND_REJECTIONS, (backend, reason)).inc()
+
+def observe_startup_phase(phase: str, seconds: float):
+    STARTUP_PHASE_DURATION.labels(phase).set(seconds)
+
+# Times the block as one call to a backend operation. Works around both plain calls and awaits:
+#   with time_backend_call("soap", "RunAction", action=name):
+#       result = await client.service.RunAction(...)
+# The outcome label is "error" when the block raises.
+@contextmanager
+def time_backend_call(backend: str, operation: str, action: str = ""):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe_backend_call(backend, operation, time.perf_counter() - start, outcome, action)
+
+# Proxy that times every method called on the wrapped object, e.g. TimedProxy(supabase.auth, "supabase", "auth").
+# Other attributes are returned as they are. With lazy=True, target is a function returning the object,
+# called on first use (for clients that are only created when needed).
+class TimedProxy:
+    def __init__(self, target, backend: str, prefix: str, lazy: bool = False):
+        self._target = None if lazy else target
+        self._factory = target if lazy else None
+        self._backend = backend
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        attr = getattr(target, name)
+        if not callable(attr):
+            return attr
+        operation = f"{self._prefix}.{name}"
+
+        def call(*args, **kwargs):
+            with time_backend_call(self._backend, operation):
+                return attr(*args, **kwargs)
+        return call
+
+# Exposes the counters the services already keep (SOAP client registry, SOAP circuit breaker and bulkhead,
+# SOAP session pool, RunAction coalescing, response cache, record indexes, claim queue and stream, document blobs) when the metrics are scraped, instead of updating Prometheus metrics on every call.
+class _ServiceStatsCollector:
+    # Without describe(), registering the collector would call collect() right away, during the imports
+    def describe(self):
+        return []
+
+    def collect(self):
+        # Imported here: the services import this module to time their backend calls
+        from app.services.soap_client import get_soap_client_stats, get_soap_guard_stats
+        from app.services.soap_actions import get_run_action_stats
+        from app.services.soap_session import get_soap_session_pool_stats
+        from app.services.response_cache import get_response_cache_stats
+        from app.services.record_index import get_record_index_stats
+        from app.services.claim_queue import get_claim_queue_stats
+        from app.services.claim_stream import get_claim_stream_stats
+        from app.services.document_metadata import get_blob_stats
+
+        soap = get_soap_client_stats()
+        yield GaugeMetricFamily("soap_clients", "SOAP clients (parsed WSDLs) kept in the registry.", value=soap["clients"])
+        yield CounterMetricFamily("soap_client_registry_hits", "SOAP client requests served from the registry.", value=soap["hits"])
+        yield CounterMetricFamily("soap_wsdl_load_seconds_saved", "Estimated WSDL load time saved by the registry.", value=soap["saved_seconds"])
+
+        guard = get_soap_guard_stats()
+        state = GaugeMetricFamily("soap_circuit_breaker_state", "1 for the current state of the SOAP circuit breaker.", labels=["state"])
+        for name in ("closed", "half_open", "open"):
+            state.add_metric([name], 1 if guard["breaker_state"] == name else 0)
+        yield state
+        yield GaugeMetricFamily("soap_circuit_breaker_failures", "Consecutive SOAP failures counted by the circuit breaker.", value=guard["breaker_failures"])
+        yield CounterMetricFamily("soap_circuit_breaker_opened", "Times the SOAP circuit breaker opened.", value=guard["breaker_opened"])
+        yield GaugeMetricFamily("soap_bulkhead_in_flight", "SOAP calls in flight.", value=guard["in_flight"])
+        yield GaugeMetricFamily("soap_bulkhead_queued", "SOAP calls waiting for a bulkhead slot.", value=guard["queued"])
+
+        pool = get_soap_session_pool_stats()
+        open_sessions = GaugeMetricFamily("soap_session_open", "1 if the SOAP session of the pool slot is open.", labels=["slot"])
+        in_flight = GaugeMetricFamily("soap_session_in_flight", "Calls of this worker using the SOAP session of the pool slot.", labels=["slot"])
+        failures = GaugeMetricFamily("soap_session_failures", "Consecutive failed calls of the SOAP session of the pool slot.", labels=["slot"])
+        calls = CounterMetricFamily("soap_session_calls", "Calls that checked out the SOAP session of the pool slot.", labels=["slot"])
+        replacements = CounterMetricFamily("soap_session_replacements", "SOAP sessions of the pool slot replaced after being rejected or failing.", labels=["slot"])
+        for session in pool:
+            slot = [str(session["slot"])]
+            open_sessions.add_metric(slot, 1 if session["open"] else 0)
+            in_flight.add_metric(slot, session["in_flight"])
+            failures.add_metric(slot, session["failures"])
+            calls.add_metric(slot, session["calls"])
+            replacements.add_metric(slot, session["replacements"])
+        yield open_sessions
+        yield in_flight
+        yield failures
+        yield calls
+        yield replacements
+
+        actions = get_run_action_stats()
+        yield CounterMetricFamily("soap_run_action_calls", "RunAction calls requested by the services.", value=actions["calls"])
+        yield CounterMetricFamily("soap_run_action_coalesced", "RunAction calls served by an identical call already in flight.", value=actions["coalesced"])
+
+        cache = get_response_cache_stats()
+        family = CounterMetricFamily("response_cache_events", "Response cache lookups and invalidations, by event.", labels=["event"])
+        for event, value in cache.items():
+            if isinstance(value, (int, float)):
+                family.add_metric([event], value)
+        yield family
+
+        indexes = get_record_index_stats()
+        events = CounterMetricFamily("record_index_events", "Record index snapshots served, loaded and updated by writes, by index.", labels=["index", "event"])
+        users = GaugeMetricFamily("record_index_users", "Users whose records are indexed in this worker, by index.", labels=["index"])
+        for name, stats in indexes.items():
+            for event in ("hits", "loads", "updates"):
+                events.add_metric([name, event], stats[event])
+            users.add_metric([name], stats["users"])
+        yield events
+        yield users
+
+        queue = get_claim_queue_stats()
+        if queue is not None:
+            submissions = GaugeMetricFamily("claim_submissions", "Claim submissions in the queue, by status.", labels=["status"])
+            for status in ("queued", "processing", "succeeded", "failed"):
+                submissions.add_metric([status], queue.get(status, 0))
+            yield submissions
+
+        stream = get_claim_stream_stats()
+        yield GaugeMetricFamily("claim_stream_subscribers", "Open claim event streams.", value=stream["subscribers"])
+        yield GaugeMetricFamily("claim_stream_watched_users", "Users whose claims the stream poller watches.", value=stream["watched_users"])
+        yield CounterMetricFamily("claim_stream_polls", "Backend polls of the claim stream poller.", value=stream["polls"])
+        yield CounterMetricFamily("claim_stream_poll_errors", "Failed claim stream polls.", value=stream["poll_errors"])
+        yield CounterMetricFamily("claim_stream_events", "Claim changes published to the streams.", value=stream["events"])
+        yield CounterMetricFamily("claim_stream_slow_clients", "Streams closed because the client did not keep up.", value=stream["slow_clients"])
+
+        blobs = get_blob_stats()
+        if blobs is not None:
+            yield GaugeMetricFamily("document_blobs", "Distinct document files (blobs) stored.", value=blobs["blobs"])
+            yield GaugeMetricFamily("document_blob_references", "Uploaded documents, each referencing one blob.", value=blobs["references"])
+            yield GaugeMetricFamily("document_blob_stored_bytes", "Bytes of the stored blobs.", value=blobs["stored_bytes"])
+            yield GaugeMetricFamily("document_blob_saved_bytes", "Bytes not stored because the uploaded content was already stored.", value=blobs["saved_bytes"])
+
+REGISTRY.register(_ServiceStatsCollector())
+
+# Returns the body and content type of the metrics in the Prometheus text exposition format.
+def render_metrics():
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_ServiceStatsCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,107 @@
+import json
+import base64
+import heapq
+import itertools
+from typing import Callable, List, Optional, Tuple
+
+# Pagination helpers shared by the list services.
+# Two modes are supported:
+# - page mode (page, page_size): classic offset pagination
+# - cursor mode (cursor, page_size): keyset pagination. The cursor is an opaque token holding the sort key of the
+#   last item returned, and the next page starts right after it, so deep pages cost the same as the first one.
+# In both modes one extra item is read to know whether there is a next page, without counting the whole result.
+
+class InvalidCursorError(ValueError):
+    pass
+
+# Encodes the sort key of an item as an opaque, URL-safe cursor.
+def encode_cursor(key: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return tuple(json.loads(base64.urlsafe_b64decode(padded.encode())))
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+# Index of the first item after the cursor key in items sorted by sort_key (descending with reverse), by bisection.
+def _cursor_start(items: List, sort_key: Callable, after: Tuple, reverse: bool) -> int:
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high) // 2
+        key = tuple(sort_key(items[middle]))
+        try:
+            before = key >= after if reverse else key <= after
+        except TypeError:
+            # A cursor whose values do not compare with the sort keys (not issued by this list)
+            raise InvalidCursorError("Invalid cursor")
+        if before:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+# Returns the requested window of items and the cursor of the next page (None on the last page).
+# sort_key must give a unique, stable key per item (e.g. (open_date, id)); reverse sorts it descending.
+# With presorted=True the items are already in that order (e.g. from IndexedSnapshot.select): they are not
+# sorted again, and a cursor page is found by bisection instead of scanning the items before it.
+def paginate(items: List, sort_key: Callable, page: int, page_size: int, cursor: Optional[str] = None, reverse: bool = False, presorted: bool = False):
+    if not presorted:
+        items = sorted(items, key=sort_key, reverse=reverse)
+    if cursor:
+        start = _cursor_start(items, sort_key, decode_cursor(cursor), reverse)
+        window = items[start:start + page_size + 1]
+    else:
+        start = (page - 1) * page_size
+        window = items[start:start + page_size + 1]
+    has_more = len(window) > page_size
+    window = window[:page_size]
+    next_cursor = encode_cursor(sort_key(window[-1])) if has_more and window else None
+    return window, next_cursor
+
+# Wrapper that inverts the order of the keys, so the bounded heap of PageWindow always drops
+# the item that comes last in the requested order.
+class _Reversed:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+# Incremental variant of paginate, for items that arrive one at a time (e.g. while a response is parsed).
+# Only the items that can still end up in the window are kept: (page - 1) * page_size + page_size + 1 of them
+# in page mode, page_size + 1 in cursor mode, whatever the number of items added.
+# result() returns the same (window, next_cursor) as paginate would for all the items added.
+class PageWindow:
+    def __init__(self, sort_key: Callable, page: int, page_size: int, cursor: Optional[str] = None, reverse: bool = False):
+        self.sort_key = sort_key
+        self.page_size = page_size
+        self.reverse = reverse
+        # Raises InvalidCursorError before anything is parsed
+        self.after = decode_cursor(cursor) if cursor else None
+        self.start = 0 if cursor else (page - 1) * page_size
+        self.limit = self.start + page_size + 1
+        # Min-heap of (order, sequence, item): the root is the item that comes last in the requested order
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def add(self, item):
+        key = tuple(self.sort_key(item))
+        if self.after is not None and not (key < self.after if self.reverse else key > self.after):
+            return
+        entry = (key if self.reverse else _Reversed(key), next(self._sequence), item)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+        elif self._heap[0][0] < entry[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def result(self):
+        items = sorted((entry[2] for entry in self._heap), key=self.sort_key, reverse=self.reverse)
+        window = items[self.start:]
+        has_more = len(window) > self.page_size
+        window = window[:self.page_size]
+        next_cursor = encode_cursor(self.sort_key(window[-1])) if has_more and window else None
+        return window, next_cursor
@@ -1,19 +1,25 @@
-from app.models.base import APIResponse, api_response
+from app.models.base import APIResponse, APIError, api_response
 from app.models.policy import PolicySummary, PolicyDetail
 from typing import List, Optional
+from app.services.response_cache import cached
+from app.services.pagination import paginate, InvalidCursorError
 
-def list_policies_service(type: Optional[str], status: Optional[str], page: int, page_size: int) -> APIResponse[List[PolicySummary]]:
+@cached("policies")
+def list_policies_service(user_id: str, type: Optional[str], status: Optional[str], page: int, page_size: int, cursor: Optional[str] = None, include_count: bool = True) -> APIResponse[List[PolicySummary]]:
     # TODO: Implement logic to fetch and filter policies from the database or external service.
-    # Should support filtering by type, status, and pagination (page, page_size).
-    # Return a list of PolicySummary objects and the total count.
+    # Should support filtering by type, status, and pagination (page, page_size or cursor).
+    # Filters, ordering (by id) and the page window should be part of the query sent to the data source.
+    # Return a list of PolicySummary objects and, only if include_count is set, the total count.
     data = [
         PolicySummary(
             id="HOM123",
             policy_number="HOM123",
             type="Home",
             status="Active",
-            start_date="2024-01-01",
-            end_date="2025-01-01",
+            payment="500.00",
+            next_payment="2024-07-01",
+            effective_date="2024-01-01",
+            expiration_date="2025-01-01",
             contract_name="Home Insurance Basic"
         ),
         PolicySummary(
@@ -21,8 +27,10 @@ def list_policies_service(type: Optional[str], status: Optional[str], page: int,
             policy_number="AUT456",
             type="Auto",
             status="Expired",
-            start_date="2023-01-01",
-            end_date="2024-01-01",
+            payment="300.00",
+            next_payment=None,
+            effective_date="2023-01-01",
+            expiration_date="2024-01-01",
             contract_name="Auto Insurance Plus"
         )
     ]
@@ -30,9 +38,15 @@ def list_policies_service(type: Optional[str], status: Optional[str], page: int,
         data = [p for p in data if p.type == type]
     if status:
         data = [p for p in data if p.status == status]
-    return api_response(data=data, count=len(data), status_code=200)
+    count = len(data) if include_count else None
+    try:
+        data, next_cursor = paginate(data, lambda p: (p.id,), page, page_size, cursor)
+    except InvalidCursorError as e:
+        return api_response(error=APIError(message=str(e)), status_code=400)
+    return api_response(data=data, count=count, next_cursor=next_cursor, status_code=200)
 
-def get_policy_service(id: str) -> APIResponse[PolicyDetail]:
+@cached("policies")
+def get_policy_service(user_id: str, id: str) -> APIResponse[PolicyDetail]:
     # TODO: Implement logic to fetch a specific policy by its ID from the database or external service.
     # Should return a PolicyDetail object if found, or an appropriate error if not found.
     detail = PolicyDetail(
@@ -40,11 +54,12 @@ def get_policy_service(id: str) -> APIResponse[PolicyDetail]:
         policy_number=id,
         type="Home" if id == "HOM123" else "Auto",
         status="Active" if id == "HOM123" else "Expired",
-        start_date="2024-01-01" if id == "HOM123" else "2023-01-01",
-        end_date="2025-01-01" if id == "HOM123" else "2024-01-01",
-        contract_name="Home Insurance Basic" if id == "HOM123" else "Auto Insurance Plus",
-        coverage_amount=100000.0 if id == "HOM123" else 20000.0,
-        premium=500.0 if id == "HOM123" else 300.0,
-        deductible=1000.0 if id == "HOM123" else 500.0
+        payment="500.00" if id == "HOM123" else "300.00",
+        payment_frequency="Yearly",
+        next_payment="2024-07-01" if id == "HOM123" else None,
+        effective_date="2024-01-01" if id == "HOM123" else "2023-01-01",
+        expiration_date="2025-01-01" if id == "HOM123" else "2024-01-01",
+        manager="John Smith",
+        contract_name="Home Insurance Basic" if id == "HOM123" else "Auto Insurance Plus"
     )
-    return api_response(data=detail, status_code=200) 
\ No newline at end of file
+    return api_response(data=detail, status_code=200)
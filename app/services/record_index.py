@@ -0,0 +1,207 @@
+import os
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+# Per-user indexed snapshots of the records behind the list endpoints (claims, documents).
+# The records of a user are loaded once, then every combination of filters is answered from the indexes:
+# - one hash index per filter field ({value: set of record ids}): a filtered query intersects the sets of
+#   its filters, starting from the smallest, instead of scanning all the records;
+# - a sorted index on the sort key of the list (e.g. (open_date, id)), so the matches come out already ordered.
+# Writes (submit_claim, upload_document_service, delete_document_service) add or remove the record in the
+# snapshot of the user, which is not loaded again. A snapshot is reloaded once RECORD_INDEX_TTL has passed,
+# so the changes made on the backend (or by another worker) show up after at most that delay.
+
+# How long (in seconds) a snapshot is used before the records are loaded again.
+RECORD_INDEX_TTL = int(os.environ.get("RECORD_INDEX_TTL", 30))
+# Maximum number of users whose snapshots are kept per index; the least recently used ones are evicted first.
+RECORD_INDEX_MAX_USERS = int(os.environ.get("RECORD_INDEX_MAX_USERS", 1000))
+
+# The records of one user. Records are objects (e.g. pydantic models) read with getattr.
+class IndexedSnapshot:
+    def __init__(self, records, index_fields, sort_key, id_field: str = "id"):
+        self.index_fields = index_fields
+        self.sort_key = sort_key
+        self.id_field = id_field
+        self._records = {}
+        self._indexes = {field: {} for field in index_fields}
+        # [(sort key, id)], kept sorted with bisect
+        self._sorted = []
+        self._lock = threading.Lock()
+        # The last record wins when the backend returns an id twice
+        for record in records:
+            self._records[getattr(record, id_field)] = record
+        for id, record in self._records.items():
+            for field, index in self._indexes.items():
+                index.setdefault(getattr(record, field), set()).add(id)
+        self._sorted = sorted((tuple(sort_key(record)), id) for id, record in self._records.items())
+
+    def __len__(self):
+        return len(self._records)
+
+    def _remove(self, id):
+        record = self._records.pop(id)
+        for field, index in self._indexes.items():
+            value = getattr(record, field)
+            ids = index[value]
+            ids.discard(id)
+            if not ids:
+                del index[value]
+        entry = (tuple(self.sort_key(record)), id)
+        del self._sorted[bisect.bisect_left(self._sorted, entry)]
+
+    def _add(self, record):
+        id = getattr(record, self.id_field)
+        if id in self._records:
+            self._remove(id)
+        self._records[id] = record
+        for field, index in self._indexes.items():
+            index.setdefault(getattr(record, field), set()).add(id)
+        bisect.insort(self._sorted, (tuple(self.sort_key(record)), id))
+
+    # Adds a record, or replaces the record with the same id.
+    def add(self, record):
+        with self._lock:
+            self._add(record)
+
+    # Removes the record with this id, if any.
+    def remove(self, id):
+        with self._lock:
+            if id in self._records:
+                self._remove(id)
+
+    # Returns the records matching every filter ({field: value}; None values are ignored), in sort order.
+    def select(self, filters: dict, reverse: bool = False):
+        filters = {field: value for field, value in filters.items() if value is not None}
+        with self._lock:
+            if not filters:
+                entries = reversed(self._sorted) if reverse else self._sorted
+                return [self._records[id] for _, id in entries]
+            sets = sorted((self._indexes[field].get(value, set()) for field, value in filters.items()), key=len)
+            ids = set(sets[0])
+            for other in sets[1:]:
+                ids &= other
+                if not ids:
+                    break
+            # Few matches: sort them. Many: walk the sorted index, which is already in order.
+            if len(ids) * 8 < len(self._sorted):
+                return sorted((self._records[id] for id in ids), key=self.sort_key, reverse=reverse)
+            entries = reversed(self._sorted) if reverse else self._sorted
+            return [self._records[id] for _, id in entries if id in ids]
+
+# The snapshots of every user for one kind of record. load(user_id) returns the records of the user
+# (a coroutine function for get_async). Records added while a snapshot is being loaded are not lost:
+# a snapshot loaded while the same user wrote is returned but not kept, and their next request loads it again.
+class RecordIndex:
+    def __init__(self, name: str, index_fields, sort_key, load):
+        self.name = name
+        self.index_fields = index_fields
+        self.sort_key = sort_key
+        self.load = load
+        # {user_id: (loaded_at, IndexedSnapshot)}, least recently used first
+        self._snapshots = OrderedDict()
+        # {user_id: [loads in flight, writes of the user]}, only for the users being loaded,
+        # to detect the writes made during a load
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "updates": 0}
+
+    # Returns (snapshot, None), or (None, writes of the user so far) when a load starts.
+    def _lookup(self, user_id: str):
+        with self._lock:
+            entry = self._snapshots.get(user_id)
+            if entry is None or time.monotonic() - entry[0] >= RECORD_INDEX_TTL:
+                loading = self._loading.setdefault(user_id, [0, 0])
+                loading[0] += 1
+                return None, loading[1]
+            self._snapshots.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1], None
+
+    # Ends a load of the user (called with _lock held) and returns their writes so far.
+    def _end_load(self, user_id: str) -> int:
+        loading = self._loading[user_id]
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[user_id]
+        return loading[1]
+
+    def _build(self, user_id: str, records) -> IndexedSnapshot:
+        try:
+            return IndexedSnapshot(records, self.index_fields, self.sort_key)
+        except BaseException:
+            with self._lock:
+                self._end_load(user_id)
+            raise
+
+    def _store(self, user_id: str, snapshot: IndexedSnapshot, writes: int, loaded_at: float):
+        with self._lock:
+            self.stats["loads"] += 1
+            if self._end_load(user_id) == writes:
+                self._snapshots[user_id] = (loaded_at, snapshot)
+                self._snapshots.move_to_end(user_id)
+                while len(self._snapshots) > RECORD_INDEX_MAX_USERS:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    # Returns the snapshot of the user, loading the records if there is none or it is too old.
+    def get(self, user_id: str) -> IndexedSnapshot:
+        snapshot, writes = self._lookup(user_id)
+        if snapshot is None:
+            loaded_at = time.monotonic()
+            try:
+                records = self.load(user_id)
+            except BaseException:
+                with self._lock:
+                    self._end_load(user_id)
+                raise
+            snapshot = self._store(user_id, self._build(user_id, records), writes, loaded_at)
+        return snapshot
+
+    async def get_async(self, user_id: str) -> IndexedSnapshot:
+        snapshot, writes = self._lookup(user_id)
+        if snapshot is None:
+            loaded_at = time.monotonic()
+            try:
+                records = await self.load(user_id)
+            except BaseException:
+                with self._lock:
+                    self._end_load(user_id)
+                raise
+            snapshot = self._store(user_id, self._build(user_id, records), writes, loaded_at)
+        return snapshot
+
+    # Counts a write of the user (for their loads in flight) and returns their snapshot, if it is loaded.
+    def _write(self, user_id: str):
+        with self._lock:
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                loading[1] += 1
+            self.stats["updates"] += 1
+            entry = self._snapshots.get(user_id)
+        return entry[1] if entry is not None else None
+
+    # Adds a record written by the user to their snapshot, if it is loaded.
+    def add(self, user_id: str, record):
+        snapshot = self._write(user_id)
+        if snapshot is not None:
+            snapshot.add(record)
+
+    # Removes a record deleted by the user from their snapshot, if it is loaded.
+    def remove(self, user_id: str, id):
+        snapshot = self._write(user_id)
+        if snapshot is not None:
+            snapshot.remove(id)
+
+_indexes = []
+
+# Creates a RecordIndex whose counters are part of get_record_index_stats().
+def create_record_index(name: str, index_fields, sort_key, load) -> RecordIndex:
+    index = RecordIndex(name, index_fields, sort_key, load)
+    _indexes.append(index)
+    return index
+
+# {index name: {"hits", "loads", "updates", "users"}}, for the metrics.
+def get_record_index_stats():
+    return {index.name: dict(index.stats, users=len(index._snapshots)) for index in _indexes}
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+# Building blocks that keep a slow or failing backend from taking the whole API down with it:
+# a circuit breaker that fails fast once the backend keeps failing, and a bulkhead that caps
+# the calls in flight to it. Both are shared by the sync (threads) and async (event loop) callers.
+
+# Raised instead of calling a backend that is considered unavailable.
+# reason is "circuit_open", "bulkhead_full" or "timeout"; status_code is the HTTP status to answer with.
+class BackendUnavailableError(Exception):
+    def __init__(self, backend: str, reason: str, retry_after: float = None):
+        super().__init__(f"{backend} backend unavailable ({reason})")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 504 if reason == "timeout" else 503
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Opens after failure_threshold consecutive failures. While open, calls fail immediately;
+    # after reset_timeout seconds one trial call is let through (half-open): it closes the breaker
+    # if it succeeds and opens it again if it fails.
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        # When the current half-open trial call started (0 when there is none). A trial that never
+        # reports back (e.g. a cancelled request) stops blocking the others after reset_timeout.
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    # Raises BackendUnavailableError if the call must not be sent.
+    # Returns True when the call is the half-open trial: see cancel_trial.
+    def before_call(self):
+        # Closed is the common case and needs no lock
+        if self.state == self.CLOSED:
+            return False
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise BackendUnavailableError(self.name, "circuit_open", retry_after=remaining)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                now = time.monotonic()
+                if now - self._trial_started < self.reset_timeout:
+                    raise BackendUnavailableError(self.name, "circuit_open", retry_after=self.reset_timeout)
+                self._trial_started = now
+                return True
+            return False
+
+    # The trial call was not sent (rejected by the bulkhead) or was cancelled before its outcome was known:
+    # the next call becomes the trial, instead of every call being rejected until reset_timeout.
+    def cancel_trial(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_started = 0.0
+
+    def record_success(self):
+        if self.state == self.CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_started = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_started = 0.0
+
+class Bulkhead:
+    # Lets at most `limit` calls run at once. Up to max_queue more wait, each for at most queue_timeout
+    # seconds, for a free slot (first come, first served); beyond that, calls are rejected immediately.
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        # Waiting callers: threading.Event for threads, (loop, future) for coroutines.
+        # A releasing caller hands its slot straight to the first waiter.
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _reject(self):
+        self.rejected += 1
+        return BackendUnavailableError(self.name, "bulkhead_full", retry_after=self.queue_timeout)
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject()
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(self.queue_timeout):
+            return
+        with self._lock:
+            # No longer queued: the slot was handed over between the timeout and taking the lock
+            if waiter not in self._waiters:
+                return
+            self._waiters.remove(waiter)
+            raise self._reject()
+
+    async def acquire_async(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject()
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        future = waiter[1]
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise self._reject()
+                    raise
+            # The slot was handed over anyway: give it back if we are not going to use it
+            if isinstance(e, asyncio.CancelledError):
+                self.release()
+                raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+            waiter = self._waiters.popleft()
+        # in_flight is unchanged: the slot goes to the waiter
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_hand_over, future)
+
+    def queued(self) -> int:
+        return len(self._waiters)
+
+def _hand_over(future):
+    if not future.done():
+        future.set_result(None)
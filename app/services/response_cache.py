@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import struct
+import asyncio
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Per-user read-through cache for the list/detail services.
+# A decorated service is called with the user id as its first argument; its successful (200) responses are
+# kept for RESPONSE_CACHE_TTL seconds and served again to the same user for the same arguments.
+# Writes call invalidate() to drop the cached responses of a user for a namespace ("claims", "documents"...).
+#
+# Stale-while-revalidate: once a response is older than RESPONSE_CACHE_TTL it is still kept for
+# RESPONSE_CACHE_STALE_TTL more seconds. During that time it is served right away, marked with an
+# "X-Cache-Status: stale" header, while one background call refreshes it. If the backend is slow or down,
+# users keep getting the last good response instead of waiting for it or getting an error.
+
+# "memory" (default): one bounded LRU cache per worker process.
+# "redis": one cache shared by all workers and instances (requires the redis package and RESPONSE_CACHE_REDIS_URL).
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# How long (in seconds) a response is served from the cache. 0 disables the cache.
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 30))
+# How long (in seconds) a response may still be served, marked as stale, after RESPONSE_CACHE_TTL. 0 disables it.
+RESPONSE_CACHE_STALE_TTL = int(os.environ.get("RESPONSE_CACHE_STALE_TTL", 60 * 60))
+# Maximum number of responses kept by the in-process backend; the least recently used ones are evicted first.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+# Threads refreshing stale responses of the sync services (async services are refreshed in the event loop).
+RESPONSE_CACHE_REFRESH_WORKERS = int(os.environ.get("RESPONSE_CACHE_REFRESH_WORKERS", 4))
+
+# Backends store (stored_at, body) pairs and drop them once they are older than the ttl passed to set().
+
+# In-process backend: an LRU dict of {key: (expires_at, stored_at, body)}.
+# Versions (used for invalidation) are kept apart so they are never evicted.
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = (now + ttl, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, scope: str) -> int:
+        return self._versions.get(scope, 0)
+
+    def bump_version(self, scope: str):
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+# Shared backend on Redis: entries expire with SETEX, versions are plain counters.
+# The value is the time it was stored (8-byte float) followed by the body.
+class RedisCacheBackend:
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        value = self._redis.get(f"response-cache:{key}")
+        if value is None:
+            return None
+        return struct.unpack("!d", value[:8])[0], value[8:]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self._redis.setex(f"response-cache:{key}", ttl, struct.pack("!d", time.time()) + value)
+
+    def get_version(self, scope: str) -> int:
+        return int(self._redis.get(f"response-cache-version:{scope}") or 0)
+
+    def bump_version(self, scope: str):
+        self._redis.incr(f"response-cache-version:{scope}")
+
+def _create_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(RESPONSE_CACHE_REDIS_URL)
+    return MemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES)
+
+_backend = _create_backend()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_hits": 0, "refreshes": 0, "refresh_errors": 0}
+# Keys being refreshed in the background, so a stale entry is only refreshed once at a time
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=RESPONSE_CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+# References to the running async refresh tasks (the event loop only keeps weak references)
+_refresh_tasks = set()
+
+def _key(namespace: str, user_id: str, func, args) -> str:
+    # The version changes every time the user's data in this namespace is invalidated,
+    # so older entries are simply never read again and expire on their own.
+    version = _backend.get_version(f"{namespace}:{user_id}")
+    return f"{namespace}:{user_id}:{version}:{func.__name__}:{json.dumps(args, default=str)}"
+
+# Returns (response, is_stale), or (None, False) on a miss.
+def _lookup(key: str):
+    entry = _backend.get(key)
+    if entry is None:
+        _stats["misses"] += 1
+        return None, False
+    stored_at, body = entry
+    age = time.time() - stored_at
+    if age < RESPONSE_CACHE_TTL:
+        _stats["hits"] += 1
+        return Response(content=body, status_code=200, media_type="application/json"), False
+    _stats["stale_hits"] += 1
+    headers = {"X-Cache-Status": "stale", "Age": str(int(age))}
+    return Response(content=body, status_code=200, media_type="application/json", headers=headers), True
+
+def _store(key: str, response):
+    if getattr(response, "status_code", None) == 200 and getattr(response, "body", None) is not None:
+        _backend.set(key, response.body, RESPONSE_CACHE_TTL + RESPONSE_CACHE_STALE_TTL)
+
+# Claims the right to refresh `key`; False if another request is already refreshing it.
+def _start_refresh(key: str) -> bool:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+def _end_refresh(key: str, response=None, error=None):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+    if error is not None:
+        _stats["refresh_errors"] += 1
+        logger.warning(f"Background refresh of a stale cached response failed: {error!r}")
+        return
+    _stats["refreshes"] += 1
+    _store(key, response)
+
+def _refresh(key: str, func, user_id, args):
+    try:
+        response = func(user_id, *args)
+    except Exception as e:
+        _end_refresh(key, error=e)
+    else:
+        _end_refresh(key, response)
+
+async def _refresh_async(key: str, func, user_id, args):
+    try:
+        response = await func(user_id, *args)
+    except Exception as e:
+        _end_refresh(key, error=e)
+    else:
+        _end_refresh(key, response)
+
+# Decorator for service functions whose first argument is the user id.
+# Works for both sync and async services.
+def cached(namespace: str):
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(user_id, *args):
+                if RESPONSE_CACHE_TTL <= 0:
+                    return await func(user_id, *args)
+                key = _key(namespace, user_id, func, args)
+                response, stale = _lookup(key)
+                if response is None:
+                    response = await func(user_id, *args)
+                    _store(key, response)
+                elif stale and _start_refresh(key):
+                    task = asyncio.get_running_loop().create_task(_refresh_async(key, func, user_id, args))
+                    _refresh_tasks.add(task)
+                    task.add_done_callback(_refresh_tasks.discard)
+                return response
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(user_id, *args):
+            if RESPONSE_CACHE_TTL <= 0:
+                return func(user_id, *args)
+            key = _key(namespace, user_id, func, args)
+            response, stale = _lookup(key)
+            if response is None:
+                response = func(user_id, *args)
+                _store(key, response)
+            elif stale and _start_refresh(key):
+                _refresh_executor.submit(_refresh, key, func, user_id, args)
+            return response
+        return wrapper
+    return decorator
+
+# Drops every cached response of the user in the given namespace.
+def invalidate(namespace: str, user_id: str):
+    _stats["invalidations"] += 1
+    _backend.bump_version(f"{namespace}:{user_id}")
+
+def get_response_cache_stats():
+    return dict(_stats)
@@ -0,0 +1,159 @@
+import json
+import asyncio
+import threading
+from app.services.soap_client import get_soap_client, get_async_soap_client, soap_call, soap_call_async
+from app.services.soap_session import call_with_session, call_with_session_async
+
+# Coalescing (single-flight) layer in front of the generic RunAction SOAP method.
+# Concurrent calls with the same action name and the same params share one in-flight backend request:
+# the first caller sends it, the others wait for its result (or its error) instead of sending their own.
+
+# In-flight sync calls: {key: _InFlight}
+_in_flight = {}
+# In-flight async calls: {key: asyncio.Task}
+_in_flight_async = {}
+_in_flight_lock = threading.Lock()
+# "calls" counts every RunAction requested by the services, "backend_calls" the ones actually sent.
+_stats = {"calls": 0, "backend_calls": 0}
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Builds the coalescing key. Params are serialized with sorted keys so that
+# {"a": 1, "b": 2} and {"b": 2, "a": 1} are the same call; elements (see action_params) by their XML.
+def _key(url, name, params):
+    return (url, name, json.dumps(params or {}, sort_keys=True, default=_json_default))
+
+def _json_default(value):
+    if hasattr(value, "tag"):
+        from lxml import etree
+        return etree.tostring(value).decode()
+    return str(value)
+
+# Builds the params of RunAction from a dict. ActionParams is an xsd:any sequence: zeep takes its content as
+# elements, one per parameter (None values are left out).
+def action_params(values: dict):
+    from lxml import etree
+    elements = []
+    for name, value in values.items():
+        if value is not None:
+            element = etree.Element(name)
+            element.text = str(value)
+            elements.append(element)
+    return {"_value_1": elements}
+
+# Each attempt goes through the circuit breaker and bulkhead and is timed separately
+# (a call retried after a session fault counts twice).
+def _send(url, name, params):
+    client = get_soap_client(url)
+    return call_with_session(
+        lambda sc: soap_call("RunAction", lambda: client.service.RunAction(sc=sc, name=name, params=params), action=name)
+    )
+
+async def _send_async(url, name, params):
+    client = await get_async_soap_client(url)
+    return await call_with_session_async(
+        lambda sc: soap_call_async("RunAction", lambda: client.service.RunAction(sc=sc, name=name, params=params), action=name)
+    )
+
+# Sends RunAction through the HTTP client of the async zeep transport and parses the answer while it is
+# downloaded: every <record_tag> element is passed to on_record as a {child name: text} dict, then freed,
+# so only the records kept by on_record stay in memory (neither the whole XML tree nor zeep objects are built).
+async def _stream_run_action(client, sc, name, params, record_tag, on_record):
+    from lxml import etree
+    from zeep.exceptions import Fault
+    envelope = etree.tostring(client.create_message(client.service, "RunAction", sc=sc, name=name, params=params))
+    operation = client.service._binding.get("RunAction")
+    headers = {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": f'"{operation.soapaction}"'}
+    address = client.service._binding_options["address"]
+    async with client.transport.client.stream("POST", address, content=envelope, headers=headers) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            try:
+                fault = etree.fromstring(body).find(".//{*}Fault")
+            except etree.XMLSyntaxError:
+                fault = None
+            if fault is not None:
+                raise Fault(fault.findtext("faultstring"), code=fault.findtext("faultcode"))
+            response.raise_for_status()
+        parser = etree.XMLPullParser(events=("end",), tag="{*}" + record_tag)
+        async for chunk in response.aiter_bytes():
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                on_record({etree.QName(child).localname: child.text for child in element if isinstance(child.tag, str)})
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        parser.close()
+
+# Streaming variant of run_action_async for large results: see _stream_run_action.
+# Not coalesced, since the records are handed to the caller's on_record as they are parsed.
+async def stream_action_async(url, name, params, record_tag, on_record):
+    client = await get_async_soap_client(url)
+    await call_with_session_async(
+        lambda sc: soap_call_async("RunAction", lambda: _stream_run_action(client, sc, name, params or {}, record_tag, on_record), action=name)
+    )
+
+# Runs the backend action `name` with `params` on the SOAP service at `url`, sharing the result with
+# identical calls that are already in flight.
+def run_action(url, name, params=None):
+    key = _key(url, name, params)
+    with _in_flight_lock:
+        _stats["calls"] += 1
+        entry = _in_flight.get(key)
+        leader = entry is None
+        if leader:
+            entry = _InFlight()
+            _in_flight[key] = entry
+            _stats["backend_calls"] += 1
+    if not leader:
+        entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+    try:
+        entry.result = _send(url, name, params or {})
+        return entry.result
+    except Exception as e:
+        entry.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        entry.done.set()
+
+# Async variant of run_action. The backend call runs in its own task, owned by the in-flight entry, and every
+# caller (the first one included) awaits it through shield: a cancelled caller (e.g. a dashboard section
+# timing out) stops waiting without cancelling the call the other requests are waiting for.
+async def run_action_async(url, name, params=None):
+    key = _key(url, name, params)
+    _stats["calls"] += 1
+    task = _in_flight_async.get(key)
+    if task is None:
+        _stats["backend_calls"] += 1
+        task = asyncio.get_running_loop().create_task(_send_async(url, name, params or {}))
+        _in_flight_async[key] = task
+        task.add_done_callback(lambda done: _end_async(key, done))
+    return await asyncio.shield(task)
+
+def _end_async(key, task):
+    if _in_flight_async.get(key) is task:
+        del _in_flight_async[key]
+    # Mark the exception as retrieved when every caller was cancelled
+    if not task.cancelled():
+        task.exception()
+
+# Returns how many RunAction calls were requested, how many reached the backend,
+# and the coalescing ratio (share of calls served by another in-flight request).
+def get_run_action_stats():
+    calls = _stats["calls"]
+    backend_calls = _stats["backend_calls"]
+    return {
+        "calls": calls,
+        "backend_calls": backend_calls,
+        "coalesced": calls - backend_calls,
+        "coalescing_ratio": (calls - backend_calls) / calls if calls else 0.0,
+    }
@@ -0,0 +1,226 @@
+import os
+import asyncio
+import tempfile
+import threading
+import time
+import logging
+import httpx
+from app.services.metrics import observe_backend_call, observe_backend_rejection, time_backend_call
+from app.services.resilience import BackendUnavailableError, Bulkhead, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Path of the on-disk cache for downloaded WSDL/XSD documents.
+# It is shared by all workers on the host, so a freshly started worker does not have to download the WSDL again.
+SOAP_WSDL_CACHE_PATH = os.environ.get("SOAP_WSDL_CACHE_PATH", os.path.join(tempfile.gettempdir(), "soap-wsdl-cache.db"))
+# How long (in seconds) a cached WSDL/XSD document is considered fresh.
+SOAP_WSDL_CACHE_TIMEOUT = int(os.environ.get("SOAP_WSDL_CACHE_TIMEOUT", 24 * 60 * 60))
+# Maximum number of keep-alive connections kept open to each SOAP host.
+SOAP_POOL_SIZE = int(os.environ.get("SOAP_POOL_SIZE", 10))
+# Seconds to wait for a connection to the SOAP host, and for its answer once the request is sent.
+SOAP_CONNECT_TIMEOUT = float(os.environ.get("SOAP_CONNECT_TIMEOUT", 3))
+SOAP_TIMEOUT = float(os.environ.get("SOAP_TIMEOUT", 15))
+# Bulkhead: SOAP calls allowed in flight at once per worker, how many more may wait for a slot, and for how long.
+SOAP_MAX_CONCURRENCY = int(os.environ.get("SOAP_MAX_CONCURRENCY", 20))
+SOAP_MAX_QUEUE = int(os.environ.get("SOAP_MAX_QUEUE", 50))
+SOAP_QUEUE_TIMEOUT = float(os.environ.get("SOAP_QUEUE_TIMEOUT", 2))
+# Circuit breaker: consecutive failures (timeouts, connection or HTTP errors; SOAP faults do not count)
+# that open it, and seconds it stays open before a trial call is let through.
+SOAP_BREAKER_FAILURES = int(os.environ.get("SOAP_BREAKER_FAILURES", 5))
+SOAP_BREAKER_RESET_TIMEOUT = float(os.environ.get("SOAP_BREAKER_RESET_TIMEOUT", 30))
+
+# zeep (and requests, which it uses) are imported by the functions that build the clients, on the first SOAP
+# call or during the startup warm-up (app/services/warmup.py), so importing the app stays fast.
+
+# One zeep Client per WSDL URL for the whole process.
+_clients = {}
+# Protects _clients so that a WSDL is only loaded once, even when several requests ask for it at the same time.
+_clients_lock = threading.Lock()
+# One zeep AsyncClient per WSDL URL for the whole process, used by the async endpoints.
+_async_clients = {}
+# Counters used to report how much WSDL fetch/parse time the registry saves.
+_stats = {"loads": 0, "hits": 0, "load_seconds": 0.0}
+# Shared by every SOAP call of the worker, sync and async
+soap_breaker = CircuitBreaker("soap", SOAP_BREAKER_FAILURES, SOAP_BREAKER_RESET_TIMEOUT)
+soap_bulkhead = Bulkhead("soap", SOAP_MAX_CONCURRENCY, SOAP_MAX_QUEUE, SOAP_QUEUE_TIMEOUT)
+
+# Builds the HTTP transport shared by every SOAP client:
+# a pooled requests.Session (keep-alive) plus the on-disk WSDL/XSD cache.
+def _build_transport():
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    from zeep.cache import SqliteCache
+    from zeep.transports import Transport
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=SOAP_POOL_SIZE, pool_maxsize=SOAP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    cache = SqliteCache(path=SOAP_WSDL_CACHE_PATH, timeout=SOAP_WSDL_CACHE_TIMEOUT)
+    return Transport(session=session, cache=cache, timeout=SOAP_TIMEOUT,
+                     operation_timeout=(SOAP_CONNECT_TIMEOUT, SOAP_TIMEOUT))
+
+# Builds the async HTTP transport: operations go through a pooled httpx.AsyncClient,
+# while the WSDL is still loaded synchronously (zeep does not load it asynchronously).
+def _build_async_transport():
+    from zeep.cache import SqliteCache
+    from zeep.transports import AsyncTransport
+    limits = httpx.Limits(max_connections=SOAP_POOL_SIZE, max_keepalive_connections=SOAP_POOL_SIZE)
+    timeout = httpx.Timeout(SOAP_TIMEOUT, connect=SOAP_CONNECT_TIMEOUT)
+    cache = SqliteCache(path=SOAP_WSDL_CACHE_PATH, timeout=SOAP_WSDL_CACHE_TIMEOUT)
+    return AsyncTransport(client=httpx.AsyncClient(limits=limits, timeout=timeout), cache=cache, timeout=SOAP_TIMEOUT)
+
+# Returns the zeep Client for the given WSDL URL, loading and parsing the WSDL only the first time.
+def get_soap_client(url):
+    client = _clients.get(url)
+    if client is not None:
+        _stats["hits"] += 1
+        return client
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            from zeep import Client
+            start = time.perf_counter()
+            client = Client(url, transport=_build_transport())
+            elapsed = time.perf_counter() - start
+            _stats["loads"] += 1
+            _stats["load_seconds"] += elapsed
+            observe_backend_call("soap", "LoadWSDL", elapsed)
+            _clients[url] = client
+            logger.info(f"Loaded WSDL {url} in {elapsed * 1000:.1f} ms")
+        else:
+            _stats["hits"] += 1
+        return client
+
+def _load_async_client(url):
+    with _clients_lock:
+        client = _async_clients.get(url)
+        if client is None:
+            from zeep import AsyncClient
+            start = time.perf_counter()
+            client = AsyncClient(url, transport=_build_async_transport())
+            elapsed = time.perf_counter() - start
+            _stats["loads"] += 1
+            _stats["load_seconds"] += elapsed
+            observe_backend_call("soap", "LoadWSDL", elapsed)
+            _async_clients[url] = client
+            logger.info(f"Loaded WSDL {url} (async) in {elapsed * 1000:.1f} ms")
+        else:
+            _stats["hits"] += 1
+        return client
+
+# Async counterpart of get_soap_client. The first load of a WSDL runs in a worker thread so it does not block the event loop.
+async def get_async_soap_client(url):
+    client = _async_clients.get(url)
+    if client is not None:
+        _stats["hits"] += 1
+        return client
+    return await asyncio.get_running_loop().run_in_executor(None, _load_async_client, url)
+
+# --- Guarded calls ---
+# Every SOAP operation goes through soap_call/soap_call_async: the circuit breaker fails fast while the
+# backend is down, the bulkhead caps the calls in flight, and the call is timed in the metrics.
+# Timeouts are raised as BackendUnavailableError("timeout") so the API answers 504 instead of 500.
+
+# A SOAP call that timed out, through the sync (requests) or the async (httpx) transport.
+def _is_timeout(exc):
+    from requests.exceptions import Timeout
+    return isinstance(exc, (Timeout, httpx.TimeoutException))
+
+# Errors that say the backend is unhealthy. A SOAP fault is an answer from a working backend.
+def _is_backend_failure(exc):
+    from zeep.exceptions import Fault
+    return not isinstance(exc, Fault)
+
+def _rejected(exc):
+    observe_backend_rejection("soap", exc.reason)
+    return exc
+
+# Runs call() as the SOAP operation `operation` (action is the RunAction name, if any).
+def soap_call(operation, call, action=""):
+    try:
+        trial = soap_breaker.before_call()
+        try:
+            soap_bulkhead.acquire()
+        except BaseException:
+            if trial:
+                soap_breaker.cancel_trial()
+            raise
+    except BackendUnavailableError as e:
+        raise _rejected(e)
+    try:
+        with time_backend_call("soap", operation, action=action):
+            result = call()
+    except Exception as e:
+        if _is_backend_failure(e):
+            soap_breaker.record_failure()
+        else:
+            soap_breaker.record_success()
+        if _is_timeout(e):
+            raise _rejected(BackendUnavailableError("soap", "timeout")) from e
+        raise
+    finally:
+        soap_bulkhead.release()
+    soap_breaker.record_success()
+    return result
+
+# Async variant of soap_call: call() must return an awaitable.
+async def soap_call_async(operation, call, action=""):
+    try:
+        trial = soap_breaker.before_call()
+        try:
+            await soap_bulkhead.acquire_async()
+        except BaseException:
+            if trial:
+                soap_breaker.cancel_trial()
+            raise
+    except BackendUnavailableError as e:
+        raise _rejected(e)
+    try:
+        with time_backend_call("soap", operation, action=action):
+            result = await call()
+    except asyncio.CancelledError:
+        if trial:
+            soap_breaker.cancel_trial()
+        raise
+    except Exception as e:
+        if _is_backend_failure(e):
+            soap_breaker.record_failure()
+        else:
+            soap_breaker.record_success()
+        if _is_timeout(e):
+            raise _rejected(BackendUnavailableError("soap", "timeout")) from e
+        raise
+    finally:
+        soap_bulkhead.release()
+    soap_breaker.record_success()
+    return result
+
+# State of the circuit breaker and the bulkhead, for the metrics.
+def get_soap_guard_stats():
+    return {
+        "breaker_state": soap_breaker.state,
+        "breaker_failures": soap_breaker.failures,
+        "breaker_opened": soap_breaker.times_opened,
+        "in_flight": soap_bulkhead.in_flight,
+        "queued": soap_bulkhead.queued(),
+        "rejected": soap_bulkhead.rejected,
+    }
+
+# Returns the registry counters and an estimate of the WSDL fetch/parse time saved by reusing clients.
+# Every hit is a Client(url) that would otherwise have been built, at the average measured load time.
+def get_soap_client_stats():
+    loads = _stats["loads"]
+    average = _stats["load_seconds"] / loads if loads else 0.0
+    return {
+        "clients": len(_clients) + len(_async_clients),
+        "loads": loads,
+        "hits": _stats["hits"],
+        "load_seconds": _stats["load_seconds"],
+        "saved_seconds": _stats["hits"] * average,
+    }
+
+# Closes the connection pools of the async clients (call it when the application shuts down).
+async def close_async_soap_clients():
+    for client in list(_async_clients.values()):
+        await client.transport.aclose()
+    _async_clients.clear()
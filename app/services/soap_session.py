@@ -1,45 +1,245 @@
+import os
+import asyncio
+import itertools
 import threading
 import time
-from zeep import Client
+import logging
+from starlette.concurrency import run_in_threadpool
+from app.services.resilience import BackendUnavailableError
+from app.services.soap_client import get_soap_client, get_async_soap_client, soap_call, soap_call_async
+from app.services.soap_session_store import create_session_store
 
-# Stores the current valid SOAP SessionId. If None, there is no active session.
-_session_id = None
-# A threading lock to ensure that only one thread at a time can update the session.
-# This prevents race conditions if multiple requests try to refresh the session simultaneously.
-_session_lock = threading.Lock()
-# Stores the expiration time (as a Unix timestamp) for the current session.
-# If the current time is greater than this value, the session is considered expired and a new login is needed.
-_session_expiry = 0  # timestamp
+logger = logging.getLogger(__name__)
+
+# The WSDL URL and credentials for the SOAP service that manages sessions.
+SOAP_URL = os.environ.get("SOAP_URL", "http://192.192.192.109:8080/soap/IBasActionService?wsdl")
+SOAP_USER = os.environ.get("SOAP_USER")
+SOAP_PASS = os.environ.get("SOAP_PASS")
+# How long (in seconds) a SOAP session is considered valid after it is opened.
+SOAP_SESSION_TTL = int(os.environ.get("SOAP_SESSION_TTL", 25 * 60))
+# How long (in seconds) before expiry the session is renewed in the background.
+SOAP_SESSION_REFRESH_MARGIN = int(os.environ.get("SOAP_SESSION_REFRESH_MARGIN", 2 * 60))
+# Comma-separated, case-insensitive fragments of the fault messages the backend returns for an invalid session.
+SOAP_SESSION_FAULT_MARKERS = [m.strip().lower() for m in os.environ.get("SOAP_SESSION_FAULT_MARKERS", "session").split(",") if m.strip()]
+# Number of sessions the calls are spread over. The backend may run the calls of one session one at a time,
+# so concurrent calls go to the least busy session instead of queueing on a single one.
+SOAP_SESSION_POOL_SIZE = max(1, int(os.environ.get("SOAP_SESSION_POOL_SIZE", 1)))
+# Consecutive failed calls (timeouts, connection errors) after which a session is replaced.
+SOAP_SESSION_MAX_FAILURES = int(os.environ.get("SOAP_SESSION_MAX_FAILURES", 3))
+
+# Where the sessions are shared with the other workers (SOAP_SESSION_STORE, see soap_session_store.py), one per slot.
+# It is only read when the session of this process is missing, expired or rejected.
+_store = create_session_store()
 
 # Logs in to the SOAP service using the configured credentials and returns a new SessionId.
 def login_soap():
-    client = Client(SOAP_URL)
-    result = client.service.OpenSession(logon=SOAP_USER, password=SOAP_PASS)
+    client = get_soap_client(SOAP_URL)
+    result = soap_call("OpenSession", lambda: client.service.OpenSession(logon=SOAP_USER, password=SOAP_PASS))
     return result.SessionId
 
-# Checks if the given SessionId is still valid by calling the SOAP service's CheckSession method.
-# Returns True if the session is valid, False otherwise.
-def check_session(session_id):
-    client = Client(SOAP_URL)
-    sc = {"SessionId": session_id, "IsAuthenticated": True}
-    try:
-        client.service.CheckSession(sc)
-        return True
-    except Exception:
-        return False
+# Async variant of login_soap.
+async def login_soap_async():
+    client = await get_async_soap_client(SOAP_URL)
+    result = await soap_call_async("OpenSession", lambda: client.service.OpenSession(logon=SOAP_USER, password=SOAP_PASS))
+    return result.SessionId
+
+def _fault_type():
+    from zeep.exceptions import Fault
+    return Fault
+
+# One session of the pool, kept in slot `slot` of the store.
+class _PooledSession:
+    def __init__(self, slot: int):
+        self.slot = slot
+        # The current session as an immutable (SessionId, expiry timestamp) tuple. (None, 0) means there is no session.
+        # Readers take a snapshot of the tuple without locking; the refreshing thread replaces the whole tuple at once,
+        # so a reader never sees a SessionId paired with the expiry of another session.
+        self.session = (None, 0)
+        # Last session the backend rejected, so it is not taken back from the store
+        self.rejected_session_id = None
+        # Calls of this worker currently using the session, and its consecutive failed calls
+        self.in_flight = 0
+        self.failures = 0
+        # Checkout order, so that sessions equally busy take turns
+        self.last_checkout = 0
+        self.calls = 0
+        self.replacements = 0
+        # Only held for the few instructions that swap the session (adopt, invalidate), never during a backend
+        # call: invalidate runs on the event loop. The OpenSession calls are serialized by the lock of the
+        # store slot (single-flight), and requests that already have a usable session take neither lock.
+        self._lock = threading.Lock()
+        # Lets the coroutines of the event loop wait for a refresh without each taking the store lock
+        # from a worker thread. Created on first use inside the event loop.
+        self._async_lock = None
+        # Timer that renews the session shortly before it expires.
+        self._renewal_timer = None
+
+    # Whether a session found in the store (or in this process) can be used instead of the stale one.
+    def _usable(self, session, stale_session_id):
+        session_id, expiry = session
+        return bool(session_id) and session_id not in (stale_session_id, self.rejected_session_id) and time.time() < expiry
+
+    # Makes session the session of this slot and schedules its renewal.
+    def _adopt(self, session):
+        with self._lock:
+            self.session = session
+            self.failures = 0
+            self._schedule_renewal(session[1])
+        return session[0]
+
+    # Opens a new session, shares it through the store and adopts it. Must be called with the store lock held.
+    def _open(self):
+        session = (login_soap(), time.time() + SOAP_SESSION_TTL)
+        _store.save(session, self.slot)
+        return self._adopt(session)
+
+    # Replaces the session unless another thread, or another worker through the store, already did it while
+    # we were waiting for the locks. stale_session_id is the session the caller saw as expired or invalid.
+    def refresh(self, stale_session_id):
+        if self._usable(self.session, stale_session_id):
+            return self.session[0]
+        handle = _store.lock(self.slot)
+        try:
+            # Replaced by another thread while we were waiting for the lock
+            if self._usable(self.session, stale_session_id):
+                return self.session[0]
+            stored = _store.load(self.slot)
+            if self._usable(stored, stale_session_id):
+                return self._adopt(stored)
+            return self._open()
+        finally:
+            _store.unlock(handle)
+
+    # Takes the store lock from a worker thread. If the caller is cancelled meanwhile, the lock is
+    # released as soon as it is obtained, instead of being held forever.
+    async def _lock_store_async(self):
+        future = asyncio.ensure_future(run_in_threadpool(_store.lock, self.slot))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: None if f.exception() else _store.unlock(f.result()))
+            raise
+
+    # Async variant of refresh: only one coroutine opens the new session, the others wait for it.
+    async def refresh_async(self, stale_session_id):
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._usable(self.session, stale_session_id):
+                return self.session[0]
+            handle = await self._lock_store_async()
+            try:
+                # Replaced by a thread (renewal timer, claim queue worker) while we were waiting for the lock
+                if self._usable(self.session, stale_session_id):
+                    return self.session[0]
+                stored = await run_in_threadpool(_store.load, self.slot)
+                if self._usable(stored, stale_session_id):
+                    return self._adopt(stored)
+                session = (await login_soap_async(), time.time() + SOAP_SESSION_TTL)
+                await run_in_threadpool(_store.save, session, self.slot)
+                return self._adopt(session)
+            finally:
+                _store.unlock(handle)
+
+    # Renews the session from the timer thread before the validity window closes.
+    def _renew_in_background(self):
+        session_id, _ = self.session
+        if not session_id:
+            return
+        try:
+            self.refresh(session_id)
+        except Exception as e:
+            # Requests keep using the current session until it expires, then they open a new one themselves
+            logger.warning(f"Background SOAP session renewal failed (slot {self.slot}): {e}")
+
+    def _schedule_renewal(self, expiry):
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+        delay = max(expiry - SOAP_SESSION_REFRESH_MARGIN - time.time(), 1)
+        self._renewal_timer = threading.Timer(delay, self._renew_in_background)
+        self._renewal_timer.daemon = True
+        self._renewal_timer.start()
+
+    # Returns a valid SessionId for this slot.
+    # While the session is within its validity window it is returned straight away, without locking and without
+    # calling CheckSession. A new session is only opened when there is none or it has expired, and only by one thread.
+    def get_id(self):
+        session_id, expiry = self.session
+        if session_id and time.time() < expiry:
+            return session_id
+        return self.refresh(session_id)
+
+    async def get_id_async(self):
+        session_id, expiry = self.session
+        if session_id and time.time() < expiry:
+            return session_id
+        return await self.refresh_async(session_id)
+
+    # Marks the session as invalid (rejected by the backend, or failing), so the next caller opens a new one
+    # (or takes the one another worker has already opened). Does nothing if the session has already been replaced.
+    def invalidate(self, session_id):
+        with self._lock:
+            self.rejected_session_id = session_id
+            if self.session[0] == session_id:
+                self.session = (None, 0)
+                self.failures = 0
+                self.replacements += 1
+
+    # Health tracking: a failed call counts against the session it used, and the session is replaced after
+    # SOAP_SESSION_MAX_FAILURES consecutive failures. A SOAP fault is an answer from a working session, and
+    # calls rejected by the circuit breaker or the bulkhead never reached it.
+    def record(self, session_id, error=None):
+        if error is None or isinstance(error, _fault_type()):
+            self.failures = 0
+            return
+        if isinstance(error, BackendUnavailableError) and error.reason != "timeout":
+            return
+        self.failures += 1
+        if self.failures >= SOAP_SESSION_MAX_FAILURES:
+            logger.warning(f"SOAP session of slot {self.slot} failed {self.failures} times in a row, replacing it")
+            self.invalidate(session_id)
 
-# Returns a valid SessionId for SOAP requests.
-# If there is no session, or the session is expired, or the session is invalid, it logs in again to obtain a new SessionId.
-# Uses a lock to ensure thread safety.
+    # Forgets the session, closing it first unless it is shared with the other workers through the store.
+    def logout(self):
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+            self._renewal_timer = None
+        session_id, _ = self.session
+        self.session = (None, 0)
+        if not session_id or _store.shared:
+            return
+        sc = {"SessionId": session_id, "IsAuthenticated": True}
+        try:
+            client = get_soap_client(SOAP_URL)
+            soap_call("CloseSession", lambda: client.service.CloseSession(sc))
+        except Exception:
+            pass
+        _store.save((None, 0), self.slot)
+
+_pool = [_PooledSession(slot) for slot in range(SOAP_SESSION_POOL_SIZE)]
+_pool_lock = threading.Lock()
+_checkouts = itertools.count(1)
+
+# Healthy sessions first, then the fewest calls in flight in this worker, then the one that waited longest.
+def _least_busy():
+    return min(_pool, key=lambda m: (m.failures > 0, m.in_flight, m.last_checkout))
+
+# Picks the session for a call. The caller must give it back with _checkin.
+def _checkout():
+    with _pool_lock:
+        member = _least_busy()
+        member.in_flight += 1
+        member.calls += 1
+        member.last_checkout = next(_checkouts)
+    return member
+
+def _checkin(member):
+    with _pool_lock:
+        member.in_flight -= 1
+
+# Returns a valid SessionId for SOAP requests (of the least busy session of the pool).
 def get_soap_session_id():
-    global _session_id, _session_expiry
-    with _session_lock:
-        now = time.time()
-        # If there is no session, or it is expired, or the check fails, log in again
-        if not _session_id or now > _session_expiry or not check_session(_session_id):
-            _session_id = login_soap()
-            _session_expiry = now + 25 * 60  # 25 minutes validity
-        return _session_id
+    return _least_busy().get_id()
 
 # Returns the security context dictionary required by SOAP methods:
 # { "SessionId": <valid session id>, "IsAuthenticated": True }
@@ -47,14 +247,88 @@ def get_soap_session_id():
 def get_security_context():
     return {"SessionId": get_soap_session_id(), "IsAuthenticated": True}
 
-# Closes the current SOAP session by calling the CloseSession method on the SOAP service, and clears the stored SessionId.
-def logout_soap():
-    global _session_id
-    if _session_id:
-        client = Client(SOAP_URL)
-        sc = {"SessionId": _session_id, "IsAuthenticated": True}
+# Opens the sessions of the pool that are not open yet (startup warm-up).
+def open_soap_sessions():
+    return [member.get_id() for member in _pool]
+
+# Returns True if the exception is a SOAP fault telling that the session is no longer valid.
+def is_session_fault(exc):
+    if not isinstance(exc, _fault_type()):
+        return False
+    message = (exc.message or "").lower()
+    return any(marker in message for marker in SOAP_SESSION_FAULT_MARKERS)
+
+# Runs call(sc) with a valid security context, on the least busy session of the pool.
+# If the backend answers that the session is invalid, the session is revalidated once (a new one is opened)
+# and the call is retried; any other error is raised unchanged.
+def call_with_session(call):
+    member = _checkout()
+    try:
+        sc = {"SessionId": member.get_id(), "IsAuthenticated": True}
         try:
-            client.service.CloseSession(sc)
-        except Exception:
-            pass
-        _session_id = None 
\ No newline at end of file
+            result = call(sc)
+        except Exception as e:
+            if not is_session_fault(e):
+                member.record(sc["SessionId"], e)
+                raise
+            logger.info("SOAP session rejected by the backend, opening a new one")
+            member.invalidate(sc["SessionId"])
+            sc = {"SessionId": member.get_id(), "IsAuthenticated": True}
+            try:
+                result = call(sc)
+            except Exception as e:
+                member.record(sc["SessionId"], e)
+                raise
+        member.record(sc["SessionId"])
+        return result
+    finally:
+        _checkin(member)
+
+# --- Async variants ---
+# They share the same sessions as the sync helpers above, but call the backend through the async transport,
+# so a request waiting on the SOAP service does not hold a threadpool worker.
+
+# Async variant of call_with_session: call(sc) must return an awaitable.
+async def call_with_session_async(call):
+    member = _checkout()
+    try:
+        sc = {"SessionId": await member.get_id_async(), "IsAuthenticated": True}
+        try:
+            result = await call(sc)
+        except Exception as e:
+            if not is_session_fault(e):
+                member.record(sc["SessionId"], e)
+                raise
+            logger.info("SOAP session rejected by the backend, opening a new one")
+            member.invalidate(sc["SessionId"])
+            sc = {"SessionId": await member.get_id_async(), "IsAuthenticated": True}
+            try:
+                result = await call(sc)
+            except Exception as e:
+                member.record(sc["SessionId"], e)
+                raise
+        member.record(sc["SessionId"])
+        return result
+    finally:
+        _checkin(member)
+
+# Closes the SOAP sessions by calling the CloseSession method on the SOAP service, and clears the stored SessionIds.
+# Sessions shared through the store are still used by the other workers: they are only forgotten by this one.
+def logout_soap():
+    for member in _pool:
+        member.logout()
+
+# State of each session of the pool, for the metrics.
+def get_soap_session_pool_stats():
+    now = time.time()
+    return [
+        {
+            "slot": member.slot,
+            "open": bool(member.session[0]) and now < member.session[1],
+            "in_flight": member.in_flight,
+            "failures": member.failures,
+            "calls": member.calls,
+            "replacements": member.replacements,
+        }
+        for member in _pool
+    ]
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from app.services.resilience import BackendUnavailableError
+
+# Where the SOAP sessions are kept, so that all the worker processes (and instances) share the same backend
+# sessions instead of each opening its own. A session is an immutable (SessionId, expiry timestamp) tuple;
+# (None, 0) means there is none. Sessions are numbered by slot (0 unless a pool of sessions is used).
+#
+# Whoever finds the session missing or expired takes the lock of its slot, reads the store again and only
+# calls OpenSession if no other process has replaced the session meanwhile (see soap_session._refresh_session).
+
+# "local" (default): kept in the worker process, every worker opens its own sessions.
+# "file": a JSON file per slot, locked with flock, shared by the workers of one host.
+# "redis": shared by every instance (requires the redis package and SOAP_SESSION_REDIS_URL).
+SOAP_SESSION_STORE = os.environ.get("SOAP_SESSION_STORE", "local")
+# Path prefix of the files of the "file" store: <path>-<slot>.json and <path>-<slot>.lock
+SOAP_SESSION_STORE_PATH = os.environ.get("SOAP_SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "soap-session"))
+SOAP_SESSION_REDIS_URL = os.environ.get("SOAP_SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Seconds a process may wait for the lock of the "redis" store, and hold it before it expires on its own
+# (so a crashed process cannot block the others).
+SOAP_SESSION_LOCK_TIMEOUT = float(os.environ.get("SOAP_SESSION_LOCK_TIMEOUT", 30))
+
+# In-process store. The lock of a slot is a threading.Lock: it serializes the refreshes of the threads
+# (requests, renewal timer, claim queue workers) and of the event loop, which takes it from a worker thread.
+class LocalSessionStore:
+    shared = False
+
+    def __init__(self):
+        self._sessions = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def load(self, slot: int = 0):
+        return self._sessions.get(slot, (None, 0))
+
+    def save(self, session, slot: int = 0):
+        self._sessions[slot] = session
+
+    def lock(self, slot: int = 0):
+        with self._locks_lock:
+            lock = self._locks.setdefault(slot, threading.Lock())
+        lock.acquire()
+        return lock
+
+    def unlock(self, handle):
+        handle.release()
+
+# Store shared by the workers of one host. The lock is an flock on a separate file: the kernel releases it
+# if the process holding it dies. The session file is replaced atomically and only readable by its owner.
+class FileSessionStore:
+    shared = True
+
+    def __init__(self, path: str):
+        try:
+            import fcntl
+        except ImportError:
+            raise RuntimeError("SOAP_SESSION_STORE=file requires a POSIX system (fcntl)")
+        self._fcntl = fcntl
+        self.path = path
+
+    def load(self, slot: int = 0):
+        try:
+            with open(f"{self.path}-{slot}.json") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, 0
+        return data["session_id"], data["expiry"]
+
+    def save(self, session, slot: int = 0):
+        path = f"{self.path}-{slot}.json"
+        if not session[0]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"session_id": session[0], "expiry": session[1]}, f)
+        os.replace(tmp, path)
+
+    # A new file descriptor per call: flock excludes other descriptors, so this also serializes
+    # the threads and the event loop of the same process.
+    def lock(self, slot: int = 0):
+        fd = os.open(f"{self.path}-{slot}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def unlock(self, handle):
+        try:
+            self._fcntl.flock(handle, self._fcntl.LOCK_UN)
+        finally:
+            os.close(handle)
+
+# Store shared by several hosts. The session expires from Redis with the session itself.
+class RedisSessionStore:
+    shared = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SOAP_SESSION_STORE=redis requires the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(url)
+
+    def load(self, slot: int = 0):
+        value = self._redis.get(f"soap-session:{slot}")
+        if value is None:
+            return None, 0
+        data = json.loads(value)
+        return data["session_id"], data["expiry"]
+
+    def save(self, session, slot: int = 0):
+        key = f"soap-session:{slot}"
+        if not session[0]:
+            self._redis.delete(key)
+            return
+        ttl = max(1, int(session[1] - time.time()))
+        self._redis.set(key, json.dumps({"session_id": session[0], "expiry": session[1]}), ex=ttl)
+
+    def lock(self, slot: int = 0):
+        lock = self._redis.lock(f"soap-session-lock:{slot}", timeout=SOAP_SESSION_LOCK_TIMEOUT,
+                                blocking_timeout=SOAP_SESSION_LOCK_TIMEOUT)
+        if not lock.acquire():
+            raise BackendUnavailableError("soap", "timeout")
+        return lock
+
+    def unlock(self, handle):
+        from redis.exceptions import LockError
+        try:
+            handle.release()
+        except LockError:
+            # Held longer than SOAP_SESSION_LOCK_TIMEOUT: it has already expired
+            pass
+
+def create_session_store():
+    if SOAP_SESSION_STORE == "file":
+        return FileSessionStore(SOAP_SESSION_STORE_PATH)
+    if SOAP_SESSION_STORE == "redis":
+        return RedisSessionStore(SOAP_SESSION_REDIS_URL)
+    return LocalSessionStore()
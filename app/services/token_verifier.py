@@ -0,0 +1,118 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import jwt
+from jwt import PyJWKClient
+from app.services.metrics import time_backend_call
+from dotenv import load_dotenv
+load_dotenv()
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+# Shared secret used by projects that still sign their tokens with HS256 (Project Settings > API > JWT Secret).
+# When it is not set, tokens are verified with the public keys published in the project's JWKS.
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+# Audience Supabase puts in the access tokens of signed-in users.
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+# How long (in seconds) the downloaded JWKS is reused before it is fetched again.
+SUPABASE_JWKS_TTL = int(os.environ.get("SUPABASE_JWKS_TTL", 600))
+# Seconds to wait for the JWKS download.
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 10))
+# How long (in seconds) the decoded claims of a token are reused, and how many tokens are kept.
+AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_MAX_SIZE = int(os.environ.get("AUTH_CACHE_MAX_SIZE", 10000))
+
+# Raised when the token itself is invalid (bad signature, expired, wrong audience...).
+class InvalidTokenError(Exception):
+    pass
+
+# Raised when the token cannot be checked locally (e.g. the JWKS could not be downloaded).
+# The caller should fall back to the remote Supabase check.
+class VerificationUnavailableError(Exception):
+    pass
+
+# PyJWKClient with the key set downloads timed in the backend_call_duration_seconds metric.
+class _TimedJWKClient(PyJWKClient):
+    def fetch_data(self):
+        with time_backend_call("supabase", "auth.jwks"):
+            return super().fetch_data()
+
+_jwks_client = None
+_jwks_lock = threading.Lock()
+
+# Decoded users, keyed by the SHA-256 of the token: {token_hash: (expires_at, user)}.
+# Ordered by last use so the least recently used entry is evicted first.
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+# Returns the JWKS client for the project. PyJWKClient keeps the key set in memory and
+# downloads it again once SUPABASE_JWKS_TTL has passed or when a token uses an unknown key id.
+def _get_jwks_client():
+    global _jwks_client
+    if _jwks_client is None:
+        with _jwks_lock:
+            if _jwks_client is None:
+                _jwks_client = _TimedJWKClient(
+                    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json",
+                    cache_jwk_set=True,
+                    lifespan=SUPABASE_JWKS_TTL,
+                    timeout=SUPABASE_TIMEOUT
+                )
+    return _jwks_client
+
+# Downloads the project's key set ahead of the first request (startup warm-up). HS256 projects need none.
+def warm_up_jwks():
+    if not SUPABASE_JWT_SECRET:
+        _get_jwks_client().get_jwk_set()
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+# Checks the signature, expiry and audience of the token and returns its claims.
+def _decode_token(token: str) -> dict:
+    try:
+        if SUPABASE_JWT_SECRET:
+            return jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"], audience=SUPABASE_JWT_AUDIENCE)
+        try:
+            signing_key = _get_jwks_client().get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise VerificationUnavailableError(str(e))
+        return jwt.decode(token, signing_key.key, algorithms=["RS256", "ES256"], audience=SUPABASE_JWT_AUDIENCE)
+    except jwt.InvalidTokenError as e:
+        raise InvalidTokenError(str(e))
+
+# Builds a user dict with the same keys the endpoints read from supabase.auth.get_user().
+def _user_from_claims(claims: dict) -> dict:
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "user_metadata": claims.get("user_metadata") or {},
+        "app_metadata": claims.get("app_metadata") or {},
+    }
+
+# Returns the user for the token, verified locally, using the cached result when there is one.
+# Raises InvalidTokenError or VerificationUnavailableError.
+def verify_token_locally(token: str) -> dict:
+    key = _hash_token(token)
+    now = time.time()
+    with _user_cache_lock:
+        entry = _user_cache.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _user_cache.move_to_end(key)
+                return entry[1]
+            del _user_cache[key]
+    claims = _decode_token(token)
+    user = _user_from_claims(claims)
+    # Never keep a user cached after its token has expired
+    expires_at = min(now + AUTH_CACHE_TTL, claims.get("exp", now))
+    with _user_cache_lock:
+        _user_cache[key] = (expires_at, user)
+        _user_cache.move_to_end(key)
+        while len(_user_cache) > AUTH_CACHE_MAX_SIZE:
+            _user_cache.popitem(last=False)
+    return user
@@ -0,0 +1,85 @@
+import os
+import asyncio
+import logging
+import time
+from starlette.concurrency import run_in_threadpool
+from app.services.auth_service import SUPABASE_AUTH_MODE, get_supabase
+from app.services.claim_queue import start_claim_workers, stop_claim_workers
+from app.services.claim_service import CLAIM_SOAP_URL, submit_claim
+from app.services.claim_stream import claim_stream
+from app.services.metrics import observe_startup_phase
+from app.services.soap_client import get_soap_client, get_async_soap_client, close_async_soap_clients
+from app.services.soap_session import SOAP_URL, open_soap_sessions, logout_soap
+from app.services.token_verifier import warm_up_jwks
+
+logger = logging.getLogger(__name__)
+
+# Startup and shutdown of a worker, run by the FastAPI lifespan in app/main.py.
+# The backend clients are created lazily, on first use. The warm-up creates them in the background as soon
+# as the worker starts, concurrently, so the first requests find them ready, without delaying the startup.
+
+# Set to false to skip the warm-up (the clients are then created by the first requests that need them).
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Runs one warm-up step and records how long it took in timings. A failing step is logged and
+# recorded as None: the requests create the client themselves later.
+async def _step(name: str, call, timings: dict):
+    start = time.perf_counter()
+    try:
+        await call()
+    except Exception as e:
+        timings[name] = None
+        logger.warning(f"Warm-up step {name} failed: {e}")
+        return False
+    timings[name] = time.perf_counter() - start
+    observe_startup_phase(name, timings[name])
+    return True
+
+# The SOAP sessions (all of the pool) need the WSDL first; the async client used by the claims loads its WSDL meanwhile.
+async def _warm_up_soap(timings: dict):
+    if await _step("soap_wsdl", lambda: run_in_threadpool(get_soap_client, SOAP_URL), timings):
+        await asyncio.gather(
+            _step("soap_session", lambda: run_in_threadpool(open_soap_sessions), timings),
+            _step("soap_wsdl_async", lambda: get_async_soap_client(CLAIM_SOAP_URL), timings),
+        )
+
+def _format(seconds):
+    return "failed" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+# Creates the Supabase client, loads the WSDLs, opens the SOAP session and (in local auth mode) downloads
+# the JWKS, all concurrently. Returns {step: seconds, or None if it failed}.
+async def warm_up() -> dict:
+    start = time.perf_counter()
+    timings = {}
+    steps = [
+        _step("supabase", lambda: run_in_threadpool(get_supabase), timings),
+        _warm_up_soap(timings),
+    ]
+    if SUPABASE_AUTH_MODE == "local":
+        steps.append(_step("jwks", lambda: run_in_threadpool(warm_up_jwks), timings))
+    await asyncio.gather(*steps)
+    total = time.perf_counter() - start
+    observe_startup_phase("warmup", total)
+    logger.info(f"Warm-up done in {_format(total)}: " + ", ".join(f"{name} {_format(seconds)}" for name, seconds in timings.items()))
+    return timings
+
+# Called when the worker starts: imports_seconds is how long importing the app took.
+# Starts the threads sending the queued claims to the backend.
+# Returns the background warm-up task (None when STARTUP_WARMUP is disabled).
+def start_up(imports_seconds: float):
+    observe_startup_phase("imports", imports_seconds)
+    logger.info(f"App imported in {_format(imports_seconds)}")
+    start_claim_workers(submit_claim)
+    if not STARTUP_WARMUP:
+        return None
+    return asyncio.create_task(warm_up())
+
+# Called when the worker stops: stops a warm-up still in progress, the claim stream poller and the claim queue
+# workers, closes the SOAP session and the connection pools of the async SOAP clients.
+async def shut_down(warm_up_task=None):
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    claim_stream.close()
+    await run_in_threadpool(stop_claim_workers)
+    await run_in_threadpool(logout_soap)
+    await close_async_soap_clients()
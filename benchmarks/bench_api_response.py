@@ -0,0 +1,55 @@
+"""
+Microbenchmark of api_response for list payloads of 10/100/1000 items.
+
+Compares the previous path (APIResponse model + .dict() + JSONResponse) with the current single-pass path
+(pydantic-core to_json on pydantic v2, orjson on pydantic v1).
+
+Usage:
+    python -m benchmarks.bench_api_response [--repeat 200]
+"""
+import argparse
+import json
+import timeit
+from fastapi.responses import JSONResponse
+from app.models.base import APIResponse, api_response
+from app.models.claim import ClaimSummary
+
+
+def legacy_api_response(*, data=None, error=None, count=None, status_code=200):
+    # api_response as it was before the fast path
+    response = APIResponse(data=data, error=error, count=count, status_code=status_code)
+    return JSONResponse(status_code=status_code, content=response.dict())
+
+
+def make_claims(n):
+    return [
+        ClaimSummary(
+            id=f"CLM{i:06d}",
+            claim_number=f"CLM{i:06d}",
+            status="Open" if i % 2 else "Closed",
+            open_date="2024-05-01",
+            description="Water damage in kitchen",
+            policy_id="HOM123",
+            contract_name="Home Insurance Basic"
+        )
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="Responses rendered per measurement")
+    args = parser.parse_args()
+
+    print(f"{'items':>6} {'legacy (us)':>12} {'fast (us)':>10} {'saved (us)':>11} {'speedup':>8}")
+    for n in (10, 100, 1000):
+        data = make_claims(n)
+        # Both paths must produce the same envelope
+        assert json.loads(legacy_api_response(data=data, count=n).body) == json.loads(api_response(data=data, count=n).body)
+        legacy = min(timeit.repeat(lambda: legacy_api_response(data=data, count=n), number=args.repeat, repeat=5)) / args.repeat
+        fast = min(timeit.repeat(lambda: api_response(data=data, count=n), number=args.repeat, repeat=5)) / args.repeat
+        print(f"{n:>6} {legacy * 1e6:>12.1f} {fast * 1e6:>10.1f} {(legacy - fast) * 1e6:>11.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
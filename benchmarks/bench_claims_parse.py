@@ -0,0 +1,78 @@
+"""
+Benchmark of the two ways of parsing the GetClaims response: zeep (the whole response is parsed into a zeep
+object tree, serialized to dicts, then filtered and paginated) versus CLAIMS_STREAMING_PARSE (each record is
+filtered and paginated while the response is downloaded).
+
+Starts the fake SOAP backend (benchmarks/fake_soap.py) for each claim count, then calls
+list_claims_service_async (bypassing the response cache) in both modes for the first page of 20 claims.
+It reports the best wall time and the peak Python memory allocated during the call (tracemalloc).
+
+Usage:
+    python -m benchmarks.bench_claims_parse [--claims 100,1000,10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from benchmarks.load_test import free_port, start_process, wait_until_ready
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+from app.services import claim_service, soap_session  # noqa: E402
+from app.services.soap_client import close_async_soap_clients  # noqa: E402
+
+# The undecorated service: every call goes to the backend
+list_claims = claim_service.list_claims_service_async.__wrapped__
+
+
+async def measure(streaming: bool, repeat: int):
+    claim_service.CLAIMS_STREAMING_PARSE = streaming
+    # First call: loads the WSDL and opens the session
+    await list_claims("bench", None, None, None, 1, 20)
+    best_seconds, peak = None, 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = await list_claims("bench", None, None, None, 1, 20)
+        seconds = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert response.status_code == 200
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds, peak
+
+
+async def run(counts, repeat: int):
+    print(f"{'claims':>7} {'mode':>10} {'time (ms)':>10} {'peak (KiB)':>11}")
+    for count in counts:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}/soap/IBasActionService?wsdl"
+        process = start_process(["-m", "benchmarks.fake_soap", "--port", str(port), "--latency", "0", "--claims", str(count)],
+                                os.path.join(tempfile.gettempdir(), "bench_claims_parse_soap.log"))
+        try:
+            wait_until_ready(url, process)
+            claim_service.CLAIM_SOAP_URL = url
+            soap_session.SOAP_URL = url
+            for streaming in (False, True):
+                seconds, peak = await measure(streaming, repeat)
+                print(f"{count:>7} {'streaming' if streaming else 'zeep':>10} {seconds * 1e3:>10.1f} {peak / 1024:>11.0f}")
+        finally:
+            process.terminate()
+            process.wait()
+            soap_session.logout_soap()
+            await close_async_soap_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", default="100,1000,10000", help="Comma-separated claim counts returned by GetClaims")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured calls per mode")
+    args = parser.parse_args()
+    asyncio.run(run([int(n) for n in args.claims.split(",")], args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of the response compression: CPU time versus bytes saved, per encoding and level.
+
+Compresses api_response bodies of 10/100/1000 claims with every available encoding (gzip always; br and zstd
+when brotli and zstandard are installed) at several levels. For each it reports the compressed size, the
+compression time and the estimated time to deliver the body (compression plus transfer) on a slow and a fast
+link, so the level settings (COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_ZSTD_LEVEL) can
+be chosen from it.
+
+Usage:
+    python -m benchmarks.bench_compression [--repeat 50] [--slow-mbps 2] [--fast-mbps 50]
+"""
+import argparse
+import timeit
+from app.middleware.compression import COMPRESSORS, GzipCompressor, BrotliCompressor, ZstdCompressor
+from app.models.base import api_response
+from benchmarks.bench_api_response import make_claims
+
+LEVELS = {
+    "gzip": (GzipCompressor, (1, 6, 9)),
+    "br": (BrotliCompressor, (1, 4, 6, 11)),
+    "zstd": (ZstdCompressor, (1, 3, 9, 19)),
+}
+
+
+def compress(compressor_class, level, body):
+    compressor = compressor_class(level)
+    return compressor.compress(body) + compressor.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="Compressions per measurement")
+    parser.add_argument("--slow-mbps", type=float, default=2.0, help="Bandwidth of the slow link (e.g. mobile), Mbit/s")
+    parser.add_argument("--fast-mbps", type=float, default=50.0, help="Bandwidth of the fast link, Mbit/s")
+    args = parser.parse_args()
+
+    def transfer_ms(size, mbps):
+        return size * 8 / (mbps * 1e6) * 1e3
+
+    missing = [name for name in LEVELS if name not in COMPRESSORS]
+    if missing:
+        print(f"Not installed, skipped: {', '.join(missing)}\n")
+    print(f"{'items':>6} {'encoding':>9} {'level':>6} {'bytes':>9} {'ratio':>6} {'cpu (us)':>9} {'MB/s':>7} "
+          f"{'slow (ms)':>10} {'fast (ms)':>10}")
+    for n in (10, 100, 1000):
+        body = api_response(data=make_claims(n), count=n).body
+        print(f"{n:>6} {'identity':>9} {'-':>6} {len(body):>9} {1.0:>6.2f} {0.0:>9.1f} {'-':>7} "
+              f"{transfer_ms(len(body), args.slow_mbps):>10.2f} {transfer_ms(len(body), args.fast_mbps):>10.2f}")
+        for name, (compressor_class, levels) in LEVELS.items():
+            if name not in COMPRESSORS:
+                continue
+            for level in levels:
+                size = len(compress(compressor_class, level, body))
+                seconds = min(timeit.repeat(lambda: compress(compressor_class, level, body), number=args.repeat, repeat=3)) / args.repeat
+                cpu_ms = seconds * 1e3
+                print(f"{n:>6} {name:>9} {level:>6} {size:>9} {len(body) / size:>6.2f} {seconds * 1e6:>9.1f} "
+                      f"{len(body) / seconds / 1e6:>7.1f} {cpu_ms + transfer_ms(size, args.slow_mbps):>10.2f} "
+                      f"{cpu_ms + transfer_ms(size, args.fast_mbps):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Local stand-in for the SOAP IBasActionService, for benchmarks.
+
+Serves a WSDL with OpenSession, CheckSession, RunAction and CloseSession, answers every call after a
+configurable latency, and returns a fixed list of claims for RunAction. Unknown sessions get a
+"Invalid session" fault, like the real backend, so the session renewal path is exercised too.
+
+Usage:
+    python -m benchmarks.fake_soap [--port 8802] [--latency 0.05] [--jitter 0.01] [--claims 50]
+The WSDL is at http://127.0.0.1:<port>/soap/IBasActionService?wsdl
+"""
+import argparse
+import asyncio
+import random
+import uuid
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+NS = "urn:IBasActionService"
+SOAP_ENV = "http://schemas.xmlsoap.org/soap/envelope/"
+CLAIM_FIELDS = ["id", "claim_number", "status", "open_date", "description", "policy_id", "contract_name"]
+
+WSDL = """<?xml version="1.0" encoding="utf-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+             xmlns:tns="{ns}" xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+             targetNamespace="{ns}" name="IBasActionService">
+  <types>
+    <xsd:schema targetNamespace="{ns}" elementFormDefault="qualified">
+      <xsd:complexType name="SessionContext">
+        <xsd:sequence>
+          <xsd:element name="SessionId" type="xsd:string" minOccurs="0"/>
+          <xsd:element name="IsAuthenticated" type="xsd:boolean" minOccurs="0"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="Claim">
+        <xsd:sequence>
+          {claim_fields}
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="ActionParams">
+        <xsd:sequence>
+          <xsd:any minOccurs="0" maxOccurs="unbounded" processContents="lax"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="ActionResult">
+        <xsd:sequence>
+          <xsd:element name="Count" type="xsd:int" minOccurs="0"/>
+          <xsd:element name="Data" type="tns:Claim" minOccurs="0" maxOccurs="unbounded"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:element name="OpenSession">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="logon" type="xsd:string" minOccurs="0"/>
+          <xsd:element name="password" type="xsd:string" minOccurs="0"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="OpenSessionResponse">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="OpenSessionResult" type="tns:SessionContext"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="CheckSession">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="sc" type="tns:SessionContext"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="CheckSessionResponse">
+        <xsd:complexType><xsd:sequence/></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="RunAction">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="sc" type="tns:SessionContext"/>
+          <xsd:element name="name" type="xsd:string"/>
+          <xsd:element name="params" type="tns:ActionParams" minOccurs="0"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="RunActionResponse">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="RunActionResult" type="tns:ActionResult"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="CloseSession">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="sc" type="tns:SessionContext"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="CloseSessionResponse">
+        <xsd:complexType><xsd:sequence/></xsd:complexType>
+      </xsd:element>
+    </xsd:schema>
+  </types>
+  {messages}
+  <portType name="IBasActionService">
+    {port_operations}
+  </portType>
+  <binding name="IBasActionServiceBinding" type="tns:IBasActionService">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    {binding_operations}
+  </binding>
+  <service name="IBasActionService">
+    <port name="IBasActionServicePort" binding="tns:IBasActionServiceBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+OPERATIONS = ["OpenSession", "CheckSession", "RunAction", "CloseSession"]
+
+
+def build_wsdl(location: str) -> str:
+    messages = "".join(
+        f'<message name="{op}Input"><part name="parameters" element="tns:{op}"/></message>'
+        f'<message name="{op}Output"><part name="parameters" element="tns:{op}Response"/></message>'
+        for op in OPERATIONS
+    )
+    port_operations = "".join(
+        f'<operation name="{op}"><input message="tns:{op}Input"/><output message="tns:{op}Output"/></operation>'
+        for op in OPERATIONS
+    )
+    binding_operations = "".join(
+        f'<operation name="{op}"><soap:operation soapAction="{NS}#{op}"/>'
+        f'<input><soap:body use="literal"/></input><output><soap:body use="literal"/></output></operation>'
+        for op in OPERATIONS
+    )
+    claim_fields = "".join(f'<xsd:element name="{f}" type="xsd:string" minOccurs="0"/>' for f in CLAIM_FIELDS)
+    return WSDL.format(
+        ns=NS, location=location, messages=messages, port_operations=port_operations,
+        binding_operations=binding_operations, claim_fields=claim_fields
+    )
+
+
+def make_claims(n: int):
+    return [
+        {
+            "id": f"CLM{i:06d}",
+            "claim_number": f"CLM{i:06d}",
+            "status": "Open" if i % 3 else "Closed",
+            "open_date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "description": "Water damage in kitchen" if i % 2 else "Minor collision",
+            "policy_id": "HOM123" if i % 2 else "AUT456",
+            "contract_name": "Home Insurance Basic" if i % 2 else "Auto Insurance Plus",
+        }
+        for i in range(n)
+    ]
+
+
+def envelope(body: str) -> str:
+    return (
+        f'<?xml version="1.0" encoding="utf-8"?>'
+        f'<soap:Envelope xmlns:soap="{SOAP_ENV}" xmlns:tns="{NS}"><soap:Body>{body}</soap:Body></soap:Envelope>'
+    )
+
+
+def fault(message: str) -> str:
+    return envelope(f"<soap:Fault><faultcode>soap:Server</faultcode><faultstring>{escape(message)}</faultstring></soap:Fault>")
+
+
+def create_app(latency: float = 0.05, jitter: float = 0.0, claims: int = 50) -> Starlette:
+    sessions = set()
+    claims_xml = "".join(
+        "<tns:Data>" + "".join(f"<tns:{k}>{escape(v)}</tns:{k}>" for k, v in claim.items()) + "</tns:Data>"
+        for claim in make_claims(claims)
+    )
+
+    async def wsdl(request: Request):
+        location = str(request.url.replace(query=""))
+        return Response(build_wsdl(location), media_type="text/xml")
+
+    async def call(request: Request):
+        root = ET.fromstring(await request.body())
+        operation = next(iter(root.find(f"{{{SOAP_ENV}}}Body")))
+        name = operation.tag.split("}")[-1]
+        session_id = operation.findtext(f"{{{NS}}}sc/{{{NS}}}SessionId")
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+        if name == "OpenSession":
+            session_id = uuid.uuid4().hex
+            sessions.add(session_id)
+            body = (f"<tns:OpenSessionResponse><tns:OpenSessionResult><tns:SessionId>{session_id}</tns:SessionId>"
+                    f"<tns:IsAuthenticated>true</tns:IsAuthenticated></tns:OpenSessionResult></tns:OpenSessionResponse>")
+        elif name not in OPERATIONS:
+            return Response(fault(f"Unknown operation {name}"), status_code=500, media_type="text/xml")
+        elif session_id not in sessions:
+            return Response(fault("Invalid session"), status_code=500, media_type="text/xml")
+        elif name == "CheckSession":
+            body = "<tns:CheckSessionResponse/>"
+        elif name == "CloseSession":
+            sessions.discard(session_id)
+            body = "<tns:CloseSessionResponse/>"
+        else:
+            body = (f"<tns:RunActionResponse><tns:RunActionResult><tns:Count>{claims}</tns:Count>{claims_xml}"
+                    f"</tns:RunActionResult></tns:RunActionResponse>")
+        return Response(envelope(body), media_type="text/xml")
+
+    return Starlette(routes=[
+        Route("/soap/IBasActionService", wsdl, methods=["GET"]),
+        Route("/soap/IBasActionService", call, methods=["POST"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8802)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--claims", type=int, default=50, help="Claims returned by RunAction")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.jitter, args.claims), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Local stand-in for the Supabase auth API (GoTrue), for benchmarks.
+
+Implements the endpoints the API calls: password sign-in (POST /auth/v1/token?grant_type=password),
+the current user (GET /auth/v1/user), logout and the JWKS document. Any email signs in with any password
+except "wrong". Access tokens are HS256 JWTs signed with --jwt-secret, so the API can also be run with
+SUPABASE_AUTH_MODE=local and the same SUPABASE_JWT_SECRET. Every call waits a configurable latency first.
+
+Usage:
+    python -m benchmarks.fake_supabase [--port 8801] [--latency 0.03] [--jitter 0.01] [--jwt-secret bench-secret]
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+import jwt
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+TOKEN_TTL = 3600
+
+
+def make_user(email: str) -> dict:
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    return {
+        "id": str(uuid.uuid5(uuid.NAMESPACE_URL, email)),
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": email,
+        "phone": "",
+        "email_confirmed_at": now,
+        "created_at": now,
+        "updated_at": now,
+        "last_sign_in_at": now,
+        "app_metadata": {"provider": "email", "providers": ["email"]},
+        "user_metadata": {"username": email.split("@")[0], "first_name": "Bench", "last_name": "User"},
+        "identities": [],
+    }
+
+
+def error(status_code: int, code: str, message: str):
+    return JSONResponse({"code": status_code, "error_code": code, "msg": message}, status_code=status_code)
+
+
+def create_app(latency: float = 0.03, jitter: float = 0.0, jwt_secret: str = "bench-secret") -> Starlette:
+    async def wait():
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def user_from_request(request: Request):
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        try:
+            claims = jwt.decode(token, jwt_secret, algorithms=["HS256"], audience="authenticated")
+        except jwt.InvalidTokenError:
+            return None
+        return make_user(claims["email"])
+
+    async def token(request: Request):
+        await wait()
+        body = await request.json()
+        if request.query_params.get("grant_type") != "password" or body.get("password") == "wrong":
+            return error(400, "invalid_credentials", "Invalid login credentials")
+        user = make_user(body["email"])
+        now = int(time.time())
+        claims = {"sub": user["id"], "email": user["email"], "aud": "authenticated", "role": "authenticated",
+                  "iat": now, "exp": now + TOKEN_TTL, "session_id": uuid.uuid4().hex}
+        return JSONResponse({
+            "access_token": jwt.encode(claims, jwt_secret, algorithm="HS256"),
+            "token_type": "bearer",
+            "expires_in": TOKEN_TTL,
+            "expires_at": now + TOKEN_TTL,
+            "refresh_token": uuid.uuid4().hex,
+            "user": user,
+        })
+
+    async def user(request: Request):
+        await wait()
+        current = user_from_request(request)
+        if current is None:
+            return error(401, "bad_jwt", "invalid JWT")
+        return JSONResponse(current)
+
+    async def logout(request: Request):
+        await wait()
+        return Response(status_code=204)
+
+    async def jwks(request: Request):
+        # Tokens are HS256: there are no public keys to publish
+        return JSONResponse({"keys": []})
+
+    return Starlette(routes=[
+        Route("/auth/v1/token", token, methods=["POST"]),
+        Route("/auth/v1/user", user, methods=["GET"]),
+        Route("/auth/v1/logout", logout, methods=["POST"]),
+        Route("/auth/v1/.well-known/jwks.json", jwks, methods=["GET"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--latency", type=float, default=0.03, help="Seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--jwt-secret", default="bench-secret", help="HS256 secret used to sign the access tokens")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.jitter, args.jwt_secret), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Load test of the API against local stand-ins of its backends.
+
+Starts the fake Supabase auth server (benchmarks/fake_supabase.py), the fake SOAP IBasActionService
+(benchmarks/fake_soap.py) and the API itself (uvicorn app.main:app) on free local ports, each in its own
+process. It then drives a weighted mix of login, /me, list, detail and upload requests at each concurrency
+level and reports requests per second and p50/p95/p99 latency per endpoint.
+
+Each virtual user logs in once, then sends requests back to back (closed loop) for --duration seconds.
+
+Usage:
+    python -m benchmarks.load_test [--concurrency 1,8,32] [--duration 10] [--soap-latency 0.05]
+        [--supabase-latency 0.03] [--auth-mode remote|local] [--mix me=3,claims_list=2,...]
+        [--output results.json] [--baseline baseline.json] [--tolerance 0.1]
+
+With --baseline, the results are compared to a previous --output file. The exit code is 1 if an endpoint
+got slower (p95) or handled fewer requests per second than the baseline by more than --tolerance.
+Environment variables of the API (e.g. RESPONSE_CACHE_TTL=0) are passed through to it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = "bench-secret"
+
+# Requests of the mix: name -> (method, path, needs a token)
+ENDPOINTS = {
+    "login": ("POST", "/v1/auth/login", False),
+    "me": ("GET", "/v1/auth/me", True),
+    "claims_list": ("GET", "/v1/claims?page=1&page_size=10", True),
+    "claim_detail": ("GET", "/v1/claims/CLM001", True),
+    "policies_list": ("GET", "/v1/policies", True),
+    "policy_detail": ("GET", "/v1/policies/HOM123", True),
+    "documents_list": ("GET", "/v1/documents", True),
+    "document_upload": ("POST", "/v1/documents", True),
+    # Not in the default mix: replaces me + the three lists, e.g. --mix dashboard=4,claim_detail=1
+    "dashboard": ("GET", "/v1/dashboard", True),
+}
+# Relative weights of the default mix: mostly reads, with a few logins and uploads.
+DEFAULT_MIX = {
+    "login": 2,
+    "me": 15,
+    "claims_list": 25,
+    "claim_detail": 15,
+    "policies_list": 15,
+    "policy_detail": 10,
+    "documents_list": 13,
+    "document_upload": 5,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Starts `python <args>` from the repository root, with its output written to log_path.
+def start_process(args, log_path: str, env=None) -> subprocess.Popen:
+    with open(log_path, "wb") as log:
+        return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout} seconds")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r} (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, index: int, upload_body: bytes, seed: int):
+        self.client = client
+        self.email = f"bench{index}@example.com"
+        self.upload_body = upload_body
+        self.random = random.Random(seed + index)
+        self.token = None
+
+    async def send(self, name: str):
+        method, path, needs_token = ENDPOINTS[name]
+        headers = {"Authorization": f"Bearer {self.token}"} if needs_token else None
+        if name == "login":
+            response = await self.client.post(path, json={"email": self.email, "password": "bench"})
+            if response.status_code == 200:
+                self.token = response.json()["data"]["access_token"]
+            return response
+        if name == "document_upload":
+            params = {"name": "Bench document", "category": "Other", "type": "pdf"}
+            files = {"file": ("bench.pdf", self.upload_body, "application/pdf")}
+            return await self.client.post(path, params=params, files=files, headers=headers)
+        return await self.client.request(method, path, headers=headers)
+
+
+async def run_level(base_url: str, concurrency: int, duration: float, mix: dict, upload_size: int, seed: int):
+    samples = {name: [] for name in mix}
+    errors = {name: 0 for name in mix}
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    upload_body = os.urandom(upload_size)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def record(user: VirtualUser, name: str):
+            start = time.perf_counter()
+            try:
+                response = await user.send(name)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if ok:
+                samples[name].append(elapsed)
+            else:
+                errors[name] += 1
+
+        async def loop(user: VirtualUser, deadline: float):
+            # Every user logs in first; that login is only reported when login is part of the mix
+            while user.token is None and time.perf_counter() < deadline:
+                if "login" in mix:
+                    await record(user, "login")
+                else:
+                    await user.send("login")
+            while time.perf_counter() < deadline:
+                await record(user, user.random.choices(names, weights)[0])
+
+        users = [VirtualUser(client, i, upload_body, seed) for i in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(loop(u, start + duration) for u in users))
+        elapsed = time.perf_counter() - start
+
+    results = {}
+    for name in names:
+        values = sorted(samples[name])
+        results[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+    return results
+
+
+def print_results(concurrency: int, results: dict):
+    print(f"\nconcurrency {concurrency}")
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['requests']:>8} {r['errors']:>6} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+# Prints the change of each endpoint against the baseline and returns the regressions found.
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    print(f"\ncomparison with the baseline (tolerance {tolerance:.0%})")
+    print(f"{'level':>5} {'endpoint':<16} {'rps':>18} {'p95 ms':>20}")
+    for level, endpoints in results.items():
+        for name, r in endpoints.items():
+            base = baseline.get(level, {}).get(name)
+            if not base or not base["requests"]:
+                continue
+            rps_change = (r["rps"] - base["rps"]) / base["rps"] if base["rps"] else 0.0
+            p95_change = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+            flag = ""
+            if rps_change < -tolerance or p95_change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((level, name))
+            print(f"{level:>5} {name:<16} {base['rps']:>7.1f} -> {r['rps']:>7.1f} "
+                  f"{base['p95_ms']:>8.1f} -> {r['p95_ms']:>8.1f} ({p95_change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of load before the first level (not reported)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Weights per endpoint, e.g. me=3,claims_list=2")
+    parser.add_argument("--upload-size", type=int, default=64 * 1024, help="Size in bytes of the uploaded file")
+    parser.add_argument("--supabase-latency", type=float, default=0.03, help="Latency of the fake Supabase in seconds")
+    parser.add_argument("--soap-latency", type=float, default=0.05, help="Latency of the fake SOAP service in seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Random +/- seconds added to the backend latencies")
+    parser.add_argument("--soap-claims", type=int, default=50, help="Claims returned by the fake SOAP service")
+    parser.add_argument("--auth-mode", choices=["remote", "local"], default="remote", help="SUPABASE_AUTH_MODE of the API")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the API")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file (usable as a baseline later)")
+    parser.add_argument("--baseline", help="Compare the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change before reporting a regression")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    supabase_port, soap_port, api_port = free_port(), free_port(), free_port()
+    soap_url = f"http://127.0.0.1:{soap_port}/soap/IBasActionService?wsdl"
+    api_url = f"http://127.0.0.1:{api_port}"
+    env = dict(
+        os.environ,
+        SUPABASE_URL=f"http://127.0.0.1:{supabase_port}",
+        SUPABASE_KEY="bench-anon-key",
+        SUPABASE_AUTH_MODE=args.auth_mode,
+        SOAP_URL=soap_url,
+        CLAIM_SOAP_URL=soap_url,
+        SOAP_USER="bench",
+        SOAP_PASS="bench",
+        SOAP_WSDL_CACHE_PATH=os.path.join(workdir, "wsdl-cache.db"),
+        DOCUMENT_STORAGE_PATH=os.path.join(workdir, "documents"),
+        DOCUMENT_DB_PATH=os.path.join(workdir, "documents.db"),
+        DOCUMENT_MAX_USER_BYTES=str(1 << 40),
+        CLAIM_QUEUE_DB_PATH=os.path.join(workdir, "claim_queue.db"),
+    )
+    if args.auth_mode == "local":
+        env["SUPABASE_JWT_SECRET"] = JWT_SECRET
+
+    print(f"logs in {workdir}")
+    processes = []
+    try:
+        jitter = str(args.jitter)
+        processes.append(start_process(["-m", "benchmarks.fake_supabase", "--port", str(supabase_port),
+                                        "--latency", str(args.supabase_latency), "--jitter", jitter, "--jwt-secret", JWT_SECRET],
+                                       os.path.join(workdir, "fake_supabase.log")))
+        processes.append(start_process(["-m", "benchmarks.fake_soap", "--port", str(soap_port),
+                                        "--latency", str(args.soap_latency), "--jitter", jitter, "--claims", str(args.soap_claims)],
+                                       os.path.join(workdir, "fake_soap.log")))
+        wait_until_ready(f"http://127.0.0.1:{supabase_port}/auth/v1/.well-known/jwks.json", processes[0])
+        wait_until_ready(soap_url, processes[1])
+        processes.append(start_process(["-m", "uvicorn", "app.main:app", "--port", str(api_port),
+                                        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+                                       os.path.join(workdir, "api.log"), env))
+        wait_until_ready(f"{api_url}/v1/health", processes[2])
+
+        if args.warmup > 0:
+            asyncio.run(run_level(api_url, max(levels), args.warmup, args.mix, args.upload_size, args.seed))
+        results = {}
+        for concurrency in levels:
+            results[str(concurrency)] = asyncio.run(run_level(api_url, concurrency, args.duration, args.mix, args.upload_size, args.seed))
+            print_results(concurrency, results[str(concurrency)])
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    if args.output:
+        meta = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
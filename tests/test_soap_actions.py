@@ -0,0 +1,46 @@
+import asyncio
+from app.services import soap_actions
+
+
+def test_cancelled_leader_does_not_cancel_followers(monkeypatch):
+    calls = []
+
+    async def send(url, name, params):
+        calls.append(name)
+        await asyncio.sleep(0.2)
+        return "claims"
+
+    monkeypatch.setattr(soap_actions, "_send_async", send)
+
+    async def scenario():
+        leader = asyncio.ensure_future(asyncio.wait_for(soap_actions.run_action_async("url", "GetClaims"), 0.05))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(soap_actions.run_action_async("url", "GetClaims"))
+        try:
+            await leader
+        except asyncio.TimeoutError:
+            pass
+        return await follower
+
+    assert asyncio.run(scenario()) == "claims"
+    assert calls == ["GetClaims"]
+    assert soap_actions._in_flight_async == {}
+
+
+def test_failure_is_shared_by_every_caller(monkeypatch):
+    async def send(url, name, params):
+        await asyncio.sleep(0.01)
+        raise ValueError("backend error")
+
+    monkeypatch.setattr(soap_actions, "_send_async", send)
+
+    async def scenario():
+        return await asyncio.gather(
+            soap_actions.run_action_async("url", "GetClaims"),
+            soap_actions.run_action_async("url", "GetClaims"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert soap_actions._in_flight_async == {}